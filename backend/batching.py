@@ -0,0 +1,81 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# --------------------------------------------------------
+# MICRO-BATCHER
+# Requests arriving within `window_ms` of the first queued one
+# (or until `max_batch` are waiting) are handed to `handler`
+# as one list; results are fanned back out in order.
+# --------------------------------------------------------
+class MicroBatcher:
+    def __init__(self, handler, window_ms=5.0, max_batch=32, name="micro-batcher"):
+        self.handler = handler
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.name = name
+
+        self.batches = 0
+        self.items = 0
+        self._start()
+        # Threads don't survive fork(): pre-forked workers get a fresh one
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def run(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            futures = [fut for _, fut in batch]
+
+            try:
+                results = self.handler(items)
+            except Exception as e:
+                for fut in futures:
+                    fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            for fut, res in zip(futures, results):
+                fut.set_result(res)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,86 @@
+import numpy as np
+
+# --------------------------------------------------------
+# POST-RETRIEVAL DIVERSIFICATION over the final candidates
+# (a few dozen at most):
+#   1. span dedup: walking in rank order, a candidate whose
+#      speaker-chunk span overlaps an already kept one by at
+#      least `max_overlap` (fraction of the smaller span) is
+#      dropped, so a window never ships alongside the speaker
+#      line or scene it shares text with. Explanations are
+#      commentary rather than play text and are exempt.
+#   2. MMR: relevance (the candidate's confidence, scaled to
+#      [0, 1]) traded against the max cosine to what is already
+#      picked, from one (n, n) similarity matrix.
+# --------------------------------------------------------
+SPAN_EXEMPT = {"explanation"}
+
+
+def span_dedup(collections, starts, ends, max_overlap=0.5):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    spans = (ends > starts) & np.array([c not in SPAN_EXEMPT for c in collections])
+
+    # Pairwise overlap of every candidate with every other one
+    inter = np.minimum.outer(ends, ends) - np.maximum.outer(starts, starts)
+    length = ends - starts
+    smaller = np.minimum.outer(length, length)
+    clash = (inter > 0) & (inter >= max_overlap * smaller) & np.outer(spans, spans)
+
+    kept = []
+    for i, row in enumerate(clash.tolist()):
+        if not any(row[j] for j in kept):
+            kept.append(i)
+    return kept
+
+
+def mmr(vectors, relevance, k, lam=0.7):
+    n = len(relevance)
+    if n <= 1:
+        return list(range(n))
+
+    v = np.asarray(vectors, dtype=np.float32)
+    sims = v @ v.T
+    rel = np.asarray(relevance, dtype=np.float32)
+    top = rel.max()
+    rel = rel / top if top > 0 else rel
+
+    picked = [int(rel.argmax())]
+    max_sim = sims[picked[0]].copy()
+    taken = np.zeros(n, dtype=bool)
+    taken[picked[0]] = True
+
+    for _ in range(min(k, n) - 1):
+        score = lam * rel - (1.0 - lam) * max_sim
+        score[taken] = -np.inf
+        best = int(score.argmax())
+        picked.append(best)
+        taken[best] = True
+        np.maximum(max_sim, sims[best], out=max_sim)
+    return picked
+
+
+def relevance(candidates):
+    if "rerank_score" not in candidates[0]:
+        return np.array([c["confidence"] for c in candidates], dtype=np.float32)
+    # Cross-encoder logits (possibly negative), shifted to >= 0;
+    # candidates past the re-ranker's budget get 0, one logit
+    # below the lowest scored one
+    scores = [c.get("rerank_score") for c in candidates]
+    floor = min(s for s in scores if s is not None) - 1.0
+    return np.array([floor if s is None else s for s in scores], dtype=np.float32) - floor
+
+
+def diversify(candidates, index, hierarchy, k=None, lam=0.7, max_overlap=0.5):
+    """Return candidates span-deduplicated and MMR-ordered (at most k of them)."""
+    if len(candidates) <= 1:
+        return candidates
+
+    rows = np.array([c["row"] for c in candidates], dtype=np.int64)
+    starts, ends = hierarchy.spans(rows)
+    keep = span_dedup([c["collection"] for c in candidates], starts, ends, max_overlap)
+
+    rel = relevance(candidates)[keep]
+    rows = rows[keep]
+    order = mmr(index.matrix[rows], rel, k or len(keep), lam)
+    return [candidates[keep[i]] for i in order]
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+
+# --------------------------------------------------------
+# Embedding backends. All of them return L2-normalized
+# float32 vectors from encode(list_of_texts).
+#   torch      : SentenceTransformer (fp32 PyTorch)
+#   onnx       : same model exported to ONNX Runtime
+#   onnx-int8  : ONNX model with dynamic int8 quantization
+# --------------------------------------------------------
+ONNX_FILES = {
+    "onnx": "model.onnx",
+    "onnx-int8": "model.int8.onnx",
+}
+
+
+def l2_normalize(m):
+    m = np.asarray(m, dtype=np.float32)
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(n > 0, n, 1.0)
+
+
+class TorchEmbedder:
+    name = "torch"
+
+    def __init__(self, model_name, threads=None):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts):
+        return np.asarray(
+            self.model.encode(list(texts), normalize_embeddings=True),
+            dtype=np.float32
+        )
+
+
+class OnnxEmbedder:
+    def __init__(self, model_dir, variant="onnx", threads=None, max_length=512):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.name = variant
+        model_path = os.path.join(model_dir, ONNX_FILES[variant])
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"{model_path} not found; run indexing/export_onnx.py first"
+            )
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    def encode(self, texts):
+        enc = self.tokenizer.encode_batch(list(texts))
+        feeds = {
+            "input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in enc], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+        }
+        feeds = {k: v for k, v in feeds.items() if k in self.input_names}
+
+        hidden = self.session.run(None, feeds)[0]
+        # bge uses the [CLS] token as the sentence embedding
+        return l2_normalize(hidden[:, 0])
+
+
+def load_embedder(backend, model_name, onnx_dir=None, threads=None):
+    if backend == "torch":
+        return TorchEmbedder(model_name, threads=threads)
+    if backend in ONNX_FILES:
+        return OnnxEmbedder(onnx_dir, variant=backend, threads=threads)
+    raise ValueError(f"Unknown embedding backend: {backend!r}")
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# --------------------------------------------------------
+# Query normalization (cache key)
+# --------------------------------------------------------
+def normalize_query(query):
+    return " ".join(query.split()).casefold()
+
+
+# --------------------------------------------------------
+# QUERY-EMBEDDING CACHE
+#   - LRU eviction by entry count
+#   - optional TTL (seconds)
+#   - optional on-disk tier: <disk_path>.npz holding keys,
+#     vectors and timestamps together, swapped in atomically
+#     (pre-forked workers all save at shutdown; the last one wins)
+# --------------------------------------------------------
+class EmbeddingCache:
+    def __init__(self, max_size=4096, ttl=None, disk_path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_path = disk_path
+
+        self._entries = OrderedDict()   # key -> (vector, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if disk_path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, query):
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1], now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query, vector):
+        key = normalize_query(query)
+        vector = np.asarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self._entries[key] = (vector, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # ----------------------------------------------------
+    # Batch lookup: misses are encoded together in one call
+    # ----------------------------------------------------
+    def get_many(self, queries, encode_fn):
+        vectors = [self.get(q) for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        if missing:
+            # Deduplicate misses so repeated queries in one batch encode once
+            uniq = list(OrderedDict((normalize_query(queries[i]), queries[i]) for i in missing).values())
+            encoded = np.asarray(encode_fn(uniq), dtype=np.float32)
+            fresh = {}
+            for q, v in zip(uniq, encoded):
+                self.put(q, v)
+                fresh[normalize_query(q)] = v
+            for i in missing:
+                vectors[i] = fresh[normalize_query(queries[i])]
+
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ----------------------------------------------------
+    # Disk tier
+    # ----------------------------------------------------
+    def _path(self):
+        return f"{self.disk_path}.npz"
+
+    def save(self):
+        if not self.disk_path:
+            return
+
+        path = self._path()
+        now = time.time()
+        with self._lock:
+            live = [(k, v, t) for k, (v, t) in self._entries.items() if not self._expired(t, now)]
+
+        if not live:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # One file per shard, written under a per-process temp name and
+        # swapped in, so keys and vectors always come from the same save
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                vectors=np.stack([v for _, v, _ in live]).astype(np.float32),
+                keys=np.array([k for k, _, _ in live], dtype=str),
+                stored_at=np.array([t for _, _, t in live], dtype=np.float64),
+            )
+        os.replace(tmp, path)
+
+    def load(self):
+        path = self._path()
+        if not os.path.exists(path):
+            return
+
+        try:
+            with np.load(path, allow_pickle=False) as shard:
+                matrix, keys, stored_at = shard["vectors"], shard["keys"].tolist(), shard["stored_at"].tolist()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable embedding cache at {self.disk_path}: {e}")
+            return
+
+        now = time.time()
+        start = max(0, len(keys) - self.max_size)
+        with self._lock:
+            for row in range(start, len(keys)):
+                if not self._expired(stored_at[row], now):
+                    self._entries[keys[row]] = (matrix[row], stored_at[row])
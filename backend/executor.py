@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    pass
+
+
+_END = object()
+
+
+# --------------------------------------------------------
+# BOUNDED EXECUTOR
+# Dedicated pool for CPU-bound pipeline work. At most
+# `max_workers` jobs run and `max_queue` wait; anything beyond
+# that is rejected immediately instead of piling up.
+# --------------------------------------------------------
+class BoundedExecutor:
+    def __init__(self, max_workers, max_queue, name="rag-worker"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _acquire(self, take=True):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"{self._pending} requests already pending")
+            if take:
+                self._pending += 1
+
+    def check(self):
+        # Admission test only, for work that starts later (iterate),
+        # e.g. once a streaming response begins
+        self._acquire(take=False)
+
+    def _release(self, _fut=None):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        self._acquire()
+        try:
+            fut = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        fut.add_done_callback(self._release)
+        return await asyncio.wrap_future(fut)
+
+    # ----------------------------------------------------
+    # Drive a sync generator on the pool, one next() per step,
+    # holding one slot for the whole iteration. The generator is
+    # closed (on the pool thread that last ran it) and the slot
+    # released when it ends, fails or the consumer goes away.
+    # ----------------------------------------------------
+    async def iterate(self, gen):
+        self._acquire()
+        last = None
+
+        def finish(_fut=None):
+            try:
+                gen.close()
+            finally:
+                self._release()
+
+        try:
+            while True:
+                last = self._pool.submit(next, gen, _END)
+                item = await asyncio.wrap_future(last)
+                if item is _END:
+                    return
+                yield item
+        finally:
+            if last is None:
+                finish()
+            else:
+                last.add_done_callback(finish)
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
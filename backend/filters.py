@@ -0,0 +1,125 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# --------------------------------------------------------
+# METADATA FILTERS: act / scene / speaker / chunk type.
+# Each key maps value -> sorted row ids (a partition of the
+# fused index), so a filtered search only scans its slice.
+# --------------------------------------------------------
+FILTER_KEYS = ("act", "scene", "speaker", "type")
+
+
+class UnsupportedFilter(ValueError):
+    # An explicit filter on metadata the loaded index doesn't carry
+    pass
+
+ROMAN = {"i": 1, "v": 5, "x": 10}
+
+
+def roman_to_int(s):
+    total, prev = 0, 0
+    for ch in reversed(s.lower()):
+        v = ROMAN[ch]
+        total = total - v if v < prev else total + v
+        prev = max(prev, v)
+    return total
+
+
+def normalize_speaker(name):
+    # Source names are noisy ("BRUTUS,", "CASSIUS O", "SERVANT I")
+    words = re.sub(r"[^A-Za-z]+", " ", name or "").split()
+    if not words or len(words[0]) < 3:
+        return ""
+    return words[0].upper()
+
+
+def normalize_value(key, value):
+    if value is None:
+        return ""
+    value = str(value).strip()
+    if key in ("act", "scene"):
+        if re.fullmatch(r"[ivxIVX]+", value):
+            return str(roman_to_int(value))
+        return value.lstrip("0") or value
+    if key == "speaker":
+        return normalize_speaker(value)
+    return value.lower()
+
+
+def build_partitions(meta_columns):
+    parts = {}
+    for key in ("act", "scene", "type"):
+        col = meta_columns.get(key)
+        if col is None:
+            continue
+        groups = {}
+        for row, v in enumerate(np.asarray(col).tolist()):
+            v = normalize_value(key, v)
+            if v:
+                groups.setdefault(v, []).append(row)
+        parts[key] = {v: np.array(rows, dtype=np.int64) for v, rows in groups.items()}
+
+    # Speaker chunks carry "speaker"; windows / scenes / explanations
+    # carry every speaker they contain as "speakers" (A|B|C)
+    groups = {}
+    for key in ("speaker", "speakers"):
+        col = meta_columns.get(key)
+        if col is None:
+            continue
+        for row, v in enumerate(np.asarray(col).tolist()):
+            for name in v.split("|"):
+                name = normalize_speaker(name)
+                if name:
+                    groups.setdefault(name, []).append(row)
+    parts["speaker"] = {v: np.unique(rows) for v, rows in groups.items()}
+    return parts
+
+
+# --------------------------------------------------------
+# AUTO-EXTRACTION from the query text:
+#   "Act 3 Scene 2", "act III, scene ii"  -> act / scene
+#   "<Name> says / tells ...", "<Name>'s speech" -> speaker
+# A name only counts as the speaker when it is the subject of
+# a speech verb ("what does the Soothsayer tell Caesar" scopes
+# to the Soothsayer, not Caesar).
+# --------------------------------------------------------
+ACT_RE = re.compile(r"\bact\s+(\d+|[ivx]+)\b", re.IGNORECASE)
+SCENE_RE = re.compile(r"\bscene\s+(\d+|[ivx]+)\b", re.IGNORECASE)
+
+SPEECH_VERBS = (
+    "say|says|said|tell|tells|told|speak|speaks|spoke|mean|means|ask|asks|asked|"
+    "argue|argues|claim|claims|reply|replies|respond|responds|declare|declares|"
+    "warn|warns|urge|urges|call|calls|describe|describes|reveal|reveals|think|thinks"
+)
+SPEECH_NOUNS = "speech|speeches|words|soliloquy|monologue|oration|lines|reply|warning"
+
+
+@lru_cache(maxsize=8)
+def speaker_pattern(speakers):
+    names = "|".join(sorted((re.escape(s) for s in speakers), key=len, reverse=True))
+    return re.compile(
+        rf"\b({names})(?:'s\s+(?:{SPEECH_NOUNS})\b|\s+(?:{SPEECH_VERBS})\b)",
+        re.IGNORECASE,
+    )
+
+
+def extract_filters(query, speakers=()):
+    found = {}
+
+    act = ACT_RE.search(query)
+    if act:
+        found["act"] = normalize_value("act", act.group(1))
+
+    scene = SCENE_RE.search(query)
+    # "scene i ..." alone is too easily plain English; roman scenes need an act
+    if scene and (scene.group(1).isdigit() or act):
+        found["scene"] = normalize_value("scene", scene.group(1))
+
+    if speakers:
+        m = speaker_pattern(tuple(sorted(speakers))).search(query)
+        if m:
+            found["speaker"] = normalize_speaker(m.group(1))
+
+    return found
@@ -0,0 +1,118 @@
+import numpy as np
+
+# --------------------------------------------------------
+# Chunk geometry (chunking/context_window.py): window i
+# covers speaker chunk ids [STEP_SIZE*i, STEP_SIZE*i + WINDOW_SIZE)
+# --------------------------------------------------------
+WINDOW_SIZE = 5
+STEP_SIZE = 3
+
+AGGREGATIONS = ("max", "mean")
+
+
+def segment_reduce(ufunc, values, starts, ends):
+    """ufunc-reduce values[s:e] (along axis 0) for every (s, e) span, in one reduceat.
+
+    Spans may overlap; every span must be non-empty (e > s).
+    """
+    # Interleaved [s0, e0, s1, e1, ...]: even slots reduce [s_i, e_i),
+    # odd slots are discarded. A sentinel row keeps e_i == n legal.
+    padded = np.concatenate([values, np.zeros((1,) + values.shape[1:], dtype=values.dtype)])
+    idx = np.empty(2 * len(starts), dtype=np.int64)
+    idx[0::2] = starts
+    idx[1::2] = ends
+    return ufunc.reduceat(padded, idx, axis=0)[0::2]
+
+
+# --------------------------------------------------------
+# SPANS: every index row mapped to the range of speaker
+# chunks it covers, as positions in play order
+#   speaker      [p, p + 1)
+#   context      its window's speaker ids
+#   scene        every speaker chunk with the same act/scene
+#   explanation  same as its scene
+# Rows that cannot be mapped get an empty span (start == end).
+# --------------------------------------------------------
+class Hierarchy:
+    def __init__(self, index, window_size=WINDOW_SIZE, step=STEP_SIZE, agg="max"):
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"agg must be one of {AGGREGATIONS}, got {agg!r}")
+        self.agg = agg
+        self.n_rows = len(index)
+        self.starts = np.zeros(self.n_rows, dtype=np.int64)
+        self.ends = np.zeros(self.n_rows, dtype=np.int64)
+
+        names = index.names
+        if "speaker" not in names:
+            self.speaker_block = (0, 0)
+            self.order = self.speaker_rows = np.zeros(0, dtype=np.int64)
+            self.agg_rows = np.zeros(0, dtype=np.int64)
+            return
+
+        # Speaker rows in play order; the matrix block stays a view and
+        # only the rows of the score matrix are permuted
+        start, end = index.segments[names.index("speaker")]
+        self.speaker_block = (start, end)
+        speaker_ids = np.array([int(i) for i in index.ids[start:end]], dtype=np.int64)
+        self.order = np.argsort(speaker_ids, kind="stable")
+        self.speaker_rows = start + self.order
+        sorted_ids = speaker_ids[self.order]
+
+        positions = np.arange(len(sorted_ids), dtype=np.int64)
+        self.starts[self.speaker_rows] = positions
+        self.ends[self.speaker_rows] = positions + 1
+
+        # Scene ranges from the speaker rows' act/scene columns
+        acts = index.meta_columns.get("act")
+        scenes = index.meta_columns.get("scene")
+        scene_span = {}
+        if acts is not None and scenes is not None:
+            for pos, row in enumerate(self.speaker_rows.tolist()):
+                key = (str(acts[row]), str(scenes[row]))
+                first, _ = scene_span.get(key, (pos, pos))
+                scene_span[key] = (first, pos + 1)
+
+        for name in ("context", "scene", "explanation"):
+            if name not in names:
+                continue
+            seg_start, seg_end = index.segments[names.index(name)]
+            rows = np.arange(seg_start, seg_end, dtype=np.int64)
+            if name == "context":
+                win = np.array([int(i) for i in index.ids[seg_start:seg_end]], dtype=np.int64)
+                self.starts[rows] = np.searchsorted(sorted_ids, win * step)
+                self.ends[rows] = np.searchsorted(sorted_ids, win * step + window_size)
+            elif acts is not None and scenes is not None:
+                for row in rows.tolist():
+                    s, e = scene_span.get((str(acts[row]), str(scenes[row])), (0, 0))
+                    self.starts[row], self.ends[row] = s, e
+
+        is_speaker = np.zeros(self.n_rows, dtype=bool)
+        is_speaker[self.speaker_rows] = True
+        self.agg_rows = np.flatnonzero(~is_speaker & (self.ends > self.starts))
+
+    def spans(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.starts[rows], self.ends[rows]
+
+    # ----------------------------------------------------
+    # Base scores for every row from the speaker vectors only:
+    # one matmul over the speaker block, then a segment max
+    # (or mean) per window / scene / explanation span
+    # ----------------------------------------------------
+    def base_scores(self, q, matrix):
+        # Scores are laid out (rows, queries) so every segment
+        # reduction runs over contiguous memory
+        start, end = self.speaker_block
+        sims = matrix[start:end] @ q.T
+        base_sp = 1.0 / (1.0 + np.maximum(2.0 - 2.0 * sims, 0.0))
+        base_sp = base_sp[self.order].astype(np.float32, copy=False)
+
+        out = np.zeros((self.n_rows, q.shape[0]), dtype=np.float32)
+        out[self.speaker_rows] = base_sp
+        if len(self.agg_rows):
+            starts, ends = self.starts[self.agg_rows], self.ends[self.agg_rows]
+            if self.agg == "max":
+                out[self.agg_rows] = segment_reduce(np.maximum, base_sp, starts, ends)
+            else:
+                out[self.agg_rows] = segment_reduce(np.add, base_sp, starts, ends) / (ends - starts)[:, None]
+        return out.T
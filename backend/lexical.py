@@ -0,0 +1,207 @@
+import hashlib
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# --------------------------------------------------------
+# Early-modern-English-aware tokenization.
+# Archaic pronouns/verbs fold onto their modern forms and
+# -est / -eth endings are stripped, so "What dost thou say"
+# and "what do you say" hit the same postings.
+# --------------------------------------------------------
+ARCHAIC = {
+    "thou": "you", "thee": "you", "ye": "you",
+    "thy": "your", "thine": "your",
+    "hath": "have", "hast": "have", "has": "have",
+    "doth": "do", "dost": "do", "does": "do", "didst": "did",
+    "art": "are", "wert": "were", "wast": "was",
+    "shalt": "shall", "wilt": "will", "canst": "can",
+    "couldst": "could", "wouldst": "would", "shouldst": "should",
+    "ere": "before", "oft": "often", "nay": "no", "ay": "yes",
+    "'tis": "it", "tis": "it", "'twas": "it", "twas": "it",
+}
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at",
+    "by", "for", "with", "from", "as", "is", "are", "was", "were", "be", "been",
+    "it", "this", "that", "these", "those", "i", "me", "my", "you", "your",
+    "he", "him", "his", "she", "her", "we", "us", "our", "they", "them", "their",
+    "what", "which", "who", "whom", "do", "did", "have", "had", "not", "no",
+    "so", "o", "shall", "will", "would", "should", "can", "could", "then",
+    "there", "here", "how", "why", "when", "where", "does", "act", "scene",
+}
+
+TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def stem(tok):
+    if len(tok) > 5 and tok.endswith(("eth", "est")):
+        return tok[:-3]
+    if len(tok) > 4 and tok.endswith("s") and not tok.endswith(("ss", "us", "is")):
+        return tok[:-1]
+    return tok
+
+
+def tokenize(text):
+    text = (text or "").lower().replace("’", "'").replace("‘", "'")
+    out = []
+    for tok in TOKEN_RE.findall(text):
+        tok = ARCHAIC.get(tok, tok)
+        if tok.endswith("'s"):
+            tok = tok[:-2]
+        tok = tok.replace("'", "")
+        if len(tok) < 2 or tok in STOPWORDS:
+            continue
+        out.append(stem(tok))
+    return out
+
+
+# --------------------------------------------------------
+# One BM25 field stored as CSR postings. Each posting holds
+# its precomputed BM25 impact (idf * saturated tf), so a
+# query is just a bincount over the matching slices.
+# --------------------------------------------------------
+class Bm25Field:
+    def __init__(self, vocab, offsets, doc_ids, impacts, n_docs):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.n_docs = n_docs
+        self.term_ids = {t: i for i, t in enumerate(vocab.tolist())}
+
+    @classmethod
+    def build(cls, token_lists, k1=1.2, b=0.75):
+        n_docs = len(token_lists)
+        doc_len = np.array([len(t) for t in token_lists], dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n_docs and doc_len.sum() else 1.0
+
+        postings = {}
+        for d, toks in enumerate(token_lists):
+            for term, tf in Counter(toks).items():
+                postings.setdefault(term, []).append((d, tf))
+
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        doc_ids, impacts = [], []
+
+        for i, term in enumerate(vocab):
+            plist = postings[term]
+            df = len(plist)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for d, tf in plist:
+                norm = tf + k1 * (1 - b + b * doc_len[d] / avgdl)
+                doc_ids.append(d)
+                impacts.append(idf * tf * (k1 + 1) / norm)
+            offsets[i + 1] = len(doc_ids)
+
+        return cls(
+            np.array(vocab, dtype=str),
+            offsets,
+            np.array(doc_ids, dtype=np.int32),
+            np.array(impacts, dtype=np.float32),
+            n_docs,
+        )
+
+    def score(self, tokens):
+        slices = [
+            (self.offsets[i], self.offsets[i + 1])
+            for i in (self.term_ids.get(t) for t in tokens) if i is not None
+        ]
+        if not slices:
+            return np.zeros(self.n_docs, dtype=np.float32)
+
+        docs = np.concatenate([self.doc_ids[s:e] for s, e in slices])
+        imps = np.concatenate([self.impacts[s:e] for s, e in slices])
+        return np.bincount(docs, weights=imps, minlength=self.n_docs).astype(np.float32)
+
+
+# --------------------------------------------------------
+# LEXICAL INDEX over every chunk level: a "text" field plus a
+# boosted "speaker" field. Docs are keyed "collection:id" so
+# scores can be aligned with the fused dense index rows.
+# --------------------------------------------------------
+FIELDS = ("text", "speaker")
+
+
+class LexicalIndex:
+    def __init__(self, keys, fields, version, speaker_boost=2.0):
+        self.keys = keys
+        self.fields = fields
+        self.version = version
+        self.speaker_boost = speaker_boost
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, docs, speaker_boost=2.0):
+        # docs: iterable of (collection, id, text, speaker)
+        docs = list(docs)
+        keys = np.array([f"{c}:{i}" for c, i, _, _ in docs], dtype=str)
+        fields = {
+            "text": Bm25Field.build([tokenize(t) for _, _, t, _ in docs]),
+            "speaker": Bm25Field.build([tokenize(s) for _, _, _, s in docs]),
+        }
+
+        h = hashlib.sha1()
+        for c, i, t, s in docs:
+            h.update(f"{c}:{i}:{s}:{t}".encode("utf-8"))
+        return cls(keys, fields, h.hexdigest()[:16], speaker_boost)
+
+    def save(self, path):
+        arrays = {"keys": self.keys, "version": np.array(self.version),
+                  "speaker_boost": np.array(self.speaker_boost)}
+        for name, f in self.fields.items():
+            arrays[f"{name}_vocab"] = f.vocab
+            arrays[f"{name}_offsets"] = f.offsets
+            arrays[f"{name}_doc_ids"] = f.doc_ids
+            arrays[f"{name}_impacts"] = f.impacts
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            keys = z["keys"]
+            fields = {
+                name: Bm25Field(
+                    z[f"{name}_vocab"], z[f"{name}_offsets"],
+                    z[f"{name}_doc_ids"], z[f"{name}_impacts"], len(keys)
+                )
+                for name in FIELDS
+            }
+            return cls(keys, fields, str(z["version"]), float(z["speaker_boost"]))
+
+    def score(self, query):
+        tokens = tokenize(query)
+        return self.fields["text"].score(tokens) + \
+            self.speaker_boost * self.fields["speaker"].score(tokens)
+
+    def score_batch(self, queries):
+        return np.stack([self.score(q) for q in queries]) if queries else \
+            np.zeros((0, len(self.keys)), dtype=np.float32)
+
+    # Column order that maps lexical scores onto other row keys
+    def alignment(self, row_keys):
+        pos = {k: i for i, k in enumerate(self.keys.tolist())}
+        return np.array([pos.get(k, -1) for k in row_keys], dtype=np.int64)
+
+
+# --------------------------------------------------------
+# FUSION of dense base scores (1 / (1 + dist)) with lexical
+# scores, both shaped (queries, rows)
+#   weighted : (1 - alpha) * dense + alpha * lexical / max(lexical)
+#   rrf      : reciprocal-rank fusion, 1/(c + rank) summed
+# --------------------------------------------------------
+def fuse_scores(dense, lexical, alpha=0.3, mode="weighted", rrf_c=60):
+    if mode == "rrf":
+        dense_rank = np.argsort(np.argsort(-dense, axis=1), axis=1)
+        lex_rank = np.argsort(np.argsort(-lexical, axis=1), axis=1)
+        lex_rrf = np.where(lexical > 0, 1.0 / (rrf_c + lex_rank + 1), 0.0)
+        return (1.0 / (rrf_c + dense_rank + 1) + lex_rrf).astype(np.float32)
+
+    top = lexical.max(axis=1, keepdims=True)
+    lex_norm = np.divide(lexical, top, out=np.zeros_like(lexical), where=top > 0)
+    return ((1.0 - alpha) * dense + alpha * lex_norm).astype(np.float32)
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import queue
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import httpx
+
+
+class LLMUnavailable(Exception):
+    pass
+
+
+class LLMTruncated(Exception):
+    # The stream failed after some tokens were already yielded
+    pass
+
+
+# --------------------------------------------------------
+# PROVIDER INTERFACE
+# stream(client, system, prompt) is an async generator of
+# text pieces; every provider shares the runner's pooled
+# httpx.AsyncClient.
+# --------------------------------------------------------
+class LLMProvider(ABC):
+    name = None
+
+    def __init__(self, model, max_output_tokens=512):
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+
+    @abstractmethod
+    def stream(self, client, system, prompt):
+        ...
+
+
+async def iter_sse_data(response):
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data = line[5:].strip()
+            if data and data != "[DONE]":
+                yield json.loads(data)
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+    def __init__(self, model, api_key, base_url=None, max_output_tokens=512):
+        super().__init__(model, max_output_tokens)
+        self.api_key = api_key
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+
+    async def stream(self, client, system, prompt):
+        url = f"{self.base_url}/models/{self.model}:streamGenerateContent"
+        body = {
+            "systemInstruction": {"parts": [{"text": system}]},
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": 0, "maxOutputTokens": self.max_output_tokens},
+        }
+        async with client.stream("POST", url, params={"alt": "sse"}, json=body,
+                                 headers={"x-goog-api-key": self.api_key or ""}) as response:
+            response.raise_for_status()
+            async for event in iter_sse_data(response):
+                for cand in event.get("candidates", [])[:1]:
+                    for part in cand.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    # Any /chat/completions server (vLLM, llama.cpp, a local mock)
+    name = "openai"
+
+    def __init__(self, model, base_url, api_key=None, max_output_tokens=512):
+        super().__init__(model, max_output_tokens)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+
+    async def stream(self, client, system, prompt):
+        body = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": 0,
+            "max_tokens": self.max_output_tokens,
+            "stream": True,
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        async with client.stream("POST", f"{self.base_url}/chat/completions",
+                                 json=body, headers=headers) as response:
+            response.raise_for_status()
+            async for event in iter_sse_data(response):
+                for choice in event.get("choices", [])[:1]:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+
+
+def load_provider(provider, model, api_key=None, base_url=None, max_output_tokens=512):
+    if provider == "gemini":
+        return GeminiProvider(model, api_key, base_url=base_url, max_output_tokens=max_output_tokens)
+    if provider == "openai":
+        if not base_url:
+            raise ValueError("LLM_PROVIDER=openai needs LLM_BASE_URL")
+        return OpenAICompatibleProvider(model, base_url, api_key=api_key,
+                                        max_output_tokens=max_output_tokens)
+    raise ValueError(f"Unknown LLM provider: {provider!r} (expected gemini | openai)")
+
+
+# --------------------------------------------------------
+# PROMPT CONTEXT under a token budget. Windows overlap each
+# other (step 3 / size 5) and the speaker lines and scenes
+# they are cut from, so chunks are taken in rank order and
+# only their not-yet-seen sentences are kept; a chunk with
+# nothing new is dropped. Tokens are estimated at ~4 chars.
+# --------------------------------------------------------
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+NORM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def build_context(chunks, budget_tokens):
+    seen = set()
+    blocks = []
+    used = 0
+
+    for c in chunks:
+        novel = []
+        for sentence in SENTENCE_RE.split(c["chunk"].strip()):
+            key = NORM_RE.sub(" ", sentence.lower()).strip()
+            if key and key not in seen:
+                seen.add(key)
+                novel.append(sentence)
+        if not novel:
+            continue
+
+        meta = c["metadata"]
+        header = f"[Act {meta.get('act')}, Scene {meta.get('scene')} | {c['collection']}]"
+        body = " ".join(novel)
+        room = budget_tokens - used - estimate_tokens(header)
+        if room <= 0:
+            break
+        if estimate_tokens(body) > room:
+            body = body[:room * 4].rsplit(" ", 1)[0] + " …"
+
+        blocks.append(f"{header}\n{body}")
+        used += estimate_tokens(blocks[-1])
+
+    return "\n\n".join(blocks)
+
+
+# --------------------------------------------------------
+# RUNNER: one background event loop owning one pooled
+# AsyncClient. Sync callers (request threads) get a plain
+# generator of tokens.
+#   - at most `concurrency` generations in flight; waiting
+#     for a slot counts against the first-token timeout
+#   - no token within `first_token_timeout` or any failure
+#     before the first token -> LLMUnavailable (caller falls
+#     back); a failure mid-answer -> LLMTruncated, after the
+#     tokens that did arrive
+#   - `timeout` bounds the whole generation
+# --------------------------------------------------------
+_DONE = object()
+
+
+class LLMRunner:
+    def __init__(self, provider, concurrency=8, timeout=30.0, first_token_timeout=8.0,
+                 max_connections=16):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        self.max_connections = max_connections
+
+        self._loop = None
+        self._client = None
+        self._sem = None
+        self._start_lock = threading.Lock()
+
+        self.requests = 0
+        self.fallbacks = 0
+        self.truncated = 0
+        self.in_flight = 0
+
+        # The loop thread does not survive fork(); children start their own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._loop = None
+        self._client = None
+        self._sem = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+
+                async def setup():
+                    self._client = httpx.AsyncClient(
+                        timeout=httpx.Timeout(self.timeout, connect=5.0),
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_connections),
+                    )
+                    self._sem = asyncio.Semaphore(self.concurrency)
+
+                asyncio.run_coroutine_threadsafe(setup(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _produce(self, system, prompt, out):
+        deadline = time.monotonic() + self.timeout
+        try:
+            async with self._sem:
+                self.in_flight += 1
+                try:
+                    gen = self.provider.stream(self._client, system, prompt)
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            piece = await asyncio.wait_for(gen.__anext__(), remaining)
+                        except StopAsyncIteration:
+                            break
+                        out.put(piece)
+                    await gen.aclose()
+                finally:
+                    self.in_flight -= 1
+            out.put(_DONE)
+        except BaseException as e:
+            out.put(e)
+
+    def stream(self, system, prompt):
+        loop = self._ensure_loop()
+        self.requests += 1
+        out = queue.Queue()
+        fut = asyncio.run_coroutine_threadsafe(self._produce(system, prompt, out), loop)
+
+        started = False
+        try:
+            while True:
+                try:
+                    item = out.get(timeout=self.timeout if started else self.first_token_timeout)
+                except queue.Empty:
+                    item = asyncio.TimeoutError()
+
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    if not started:
+                        self.fallbacks += 1
+                        raise LLMUnavailable(repr(item)) from item
+                    self.truncated += 1
+                    raise LLMTruncated(repr(item)) from item
+
+                started = True
+                yield item
+        finally:
+            fut.cancel()
+
+    def close(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    def stats(self):
+        return {
+            "provider": self.provider.name,
+            "model": self.provider.model,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "fallbacks": self.fallbacks,
+            "truncated": self.truncated,
+            "concurrency": self.concurrency,
+        }
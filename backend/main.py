@@ -1,39 +1,446 @@
-from fastapi import FastAPI
+import hmac
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, Union
+
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from rag import rag_pipeline
+from executor import BoundedExecutor, Overloaded
+from filters import UnsupportedFilter
+from metrics import (
+    CONTENT_TYPE,
+    ERRORS_TOTAL,
+    IN_FLIGHT,
+    REGISTRY,
+    REQUEST_SECONDS,
+    REQUESTS_TOTAL,
+    STAGE_SECONDS,
+)
+from responses import json_response, project_sources
+from vector_index import chunk_key
+from rag import (
+    retrieve_top_k,
+    get_chunk,
+    resolve_filters,
+    generate_answer,
+    generate_answer_stream,
+    rag_pipeline_batch,
+    embedding_cache,
+    batcher,
+    reranker,
+    response_cache,
+    semantic_cache,
+    response_cache_key,
+    index_version,
+    get_index,
+    warm_up,
+    is_ready,
+    startup_timings,
+    llm_stats,
+    close_llm,
+    CACHEABLE_ANSWERS,
+)
+
+
+# --------------------------------------------------------
+# Dedicated pool for embedding / search / generation
+# --------------------------------------------------------
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "16"))
+QUERY_QUEUE = int(os.getenv("QUERY_QUEUE", "64"))
+
+executor = BoundedExecutor(max_workers=QUERY_WORKERS, max_queue=QUERY_QUEUE)
+
+# /query/batch limits
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "256"))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "32"))
+
+
+# Per-request stage breakdown in a Server-Timing header
+TIMING_HEADER = os.getenv("TIMING_HEADER", "1") == "1"
+
+# background: serve /test immediately, /ready flips once warm
+# eager:      block startup until the model and index are warm
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if WARMUP_MODE == "eager":
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    executor.shutdown()
+    close_llm()
+    # Persist warm query embeddings so restarts don't start cold
+    embedding_cache.save()
+
 
 app = FastAPI(
     title="Shakespearean Scholar RAG API",
     description="Backend API for Julius Caesar Expert System",
     version="1.0",
+    lifespan=lifespan,
 )
+
+# --------------------------------------------------------
+# METRICS: request counters / latency / in-flight for every
+# route, plus cache, index and pool state sampled at scrape.
+# Plain ASGI so a request counts until its last body chunk
+# is sent (streamed responses included), not until headers.
+# --------------------------------------------------------
+class TrackRequests:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        status = "500"
+
+        async def send_tracked(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_tracked)
+        finally:
+            IN_FLIGHT.dec()
+            route = scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint)
+            REQUESTS_TOTAL.inc(endpoint=endpoint, status=status)
+            if status.startswith("5"):
+                ERRORS_TOTAL.inc(endpoint=endpoint)
+
+app.add_middleware(TrackRequests)
+
+def cache_samples(field):
+    caches = {"response": response_cache, "embedding": embedding_cache, "semantic": semantic_cache}
+    return lambda: [
+        ((name,), cache.stats()[field]) for name, cache in caches.items() if cache is not None
+    ]
+
+REGISTRY.callback("rag_cache_hits_total", "Cache hits", "counter",
+                  cache_samples("hits"), ["cache"])
+REGISTRY.callback("rag_cache_misses_total", "Cache misses", "counter",
+                  cache_samples("misses"), ["cache"])
+REGISTRY.callback("rag_cache_entries", "Entries currently cached", "gauge",
+                  cache_samples("size"), ["cache"])
+REGISTRY.callback("rag_index_rows", "Rows in the fused vector index", "gauge",
+                  lambda: [((), len(get_index()) if is_ready() else 0)])
+REGISTRY.callback("rag_executor_pending", "Jobs running or queued on the query pool", "gauge",
+                  lambda: [((), executor.pending)])
+REGISTRY.callback("rag_executor_rejected_total", "Jobs rejected with 503", "counter",
+                  lambda: [((), executor.rejected)])
+REGISTRY.callback("rag_ready", "1 once warm-up has completed", "gauge",
+                  lambda: [((), 1 if is_ready() else 0)])
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 ########
+class Filters(BaseModel):
+    act: Optional[Union[int, str]] = None
+    scene: Optional[Union[int, str]] = None
+    speaker: Optional[str] = None
+    type: Optional[str] = None     # speech | stage_direction | context_window | scene_context | explanation
+
 class Query(BaseModel):
     query: str
+    filters: Optional[Filters] = None
+    # Also pick up "Act 3 Scene 2" / "<Name> says" from the text;
+    # unset follows the server's AUTO_FILTERS
+    auto_filters: Optional[bool] = None
 
-@app.post("/query")
-def ask_question(body: Query):
-    answer, raw_sources = rag_pipeline(body.query)
+    def filter_dict(self):
+        return self.filters.model_dump(exclude_none=True) if self.filters else {}
+
+class BatchQuery(BaseModel):
+    queries: List[str]
+    stream: bool = False
+    filters: Optional[Filters] = None      # applied to every query
+    auto_filters: Optional[bool] = None
 
+    def filter_dict(self):
+        return self.filters.model_dump(exclude_none=True) if self.filters else {}
+
+def clean_sources(raw_sources):
+    # Already in final order (first-stage score, or re-ranker score)
     cleaned_sources = []
     for s in raw_sources:
         md = s["metadata"]
 
-        cleaned_sources.append({
+        source = {
+            "id": chunk_key(s["collection"], s["id"]),
             "text": s["chunk"],
             "act": md.get("act"),
             "scene": md.get("scene"),
             "collection": s["collection"],
             "confidence": round(s["confidence"], 4)
+        }
+        if "rerank_score" in s:
+            source["rerank_score"] = round(s["rerank_score"], 4)
+        cleaned_sources.append(source)
+
+    return cleaned_sources
+
+def timed_pipeline(body, t_submit):
+    timings = {}
+
+    t0 = time.perf_counter()
+    timings["queue"] = (t0 - t_submit) * 1000
+    filters = resolve_filters(body.query, body.filter_dict(), body.auto_filters)
+    raw_sources = retrieve_top_k(body.query, filters=filters)
+    t1 = time.perf_counter()
+    status = {}
+    answer = generate_answer(body.query, raw_sources, status)
+    t2 = time.perf_counter()
+
+    timings["retrieve"] = (t1 - t0) * 1000
+    timings["generate"] = (t2 - t1) * 1000
+    return answer, status["answer"], raw_sources, filters, timings
+
+def body_cache_key(body):
+    return response_cache_key(body.query, body.filter_dict(), body.auto_filters)
+
+async def cache_key_for(body):
+    # The key needs index_version(); until warm-up is done that would
+    # load the index (or wait on its lock) on the event loop
+    if is_ready():
+        return body_cache_key(body)
+    return await executor.run(body_cache_key, body)
+
+def retrieve_for(body):
+    filters = resolve_filters(body.query, body.filter_dict(), body.auto_filters)
+    return retrieve_top_k(body.query, filters=filters), filters
+
+def record_timings(timings):
+    for name, ms in timings.items():
+        STAGE_SECONDS.observe(ms / 1000, stage=name)
+    if not TIMING_HEADER:
+        return {}
+    return {"Server-Timing": ", ".join(f"{name};dur={ms:.2f}" for name, ms in timings.items())}
+
+# Results are cached with full-text sources; `sources` picks
+# what the client receives (ids | snippet | full, see responses.py)
+SourceMode = Literal["ids", "snippet", "full"]
+
+def shape_result(result, mode):
+    if mode == "full":
+        return result
+    return {**result, "sources": project_sources(result["sources"], mode)}
+
+@app.post("/query")
+async def ask_question(body: Query, request: Request, sources: SourceMode = "full"):
+    try:
+        key = await cache_key_for(body)
+        cached = response_cache.get(key)
+        if cached is not None:
+            headers = {"Server-Timing": "cache;desc=hit"} if TIMING_HEADER else {}
+            return json_response(request, shape_result(cached, sources), headers)
+
+        t_submit = time.perf_counter()
+        answer, answer_status, raw_sources, filters, timings = await executor.run(timed_pipeline, body, t_submit)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly",
+                            headers={"Retry-After": "1"})
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    t_shape = time.perf_counter()
+    result = {
+        "answer": answer,
+        "answer_status": answer_status,
+        "sources": clean_sources(raw_sources),
+        "filters": filters
+    }
+    # Fallback and cut-off answers are served, never cached
+    if answer_status in CACHEABLE_ANSWERS:
+        response_cache.set(key, result)
+    result = shape_result(result, sources)
+
+    timings["shape"] = (time.perf_counter() - t_shape) * 1000
+    return json_response(request, result, record_timings(timings))
+
+@app.get("/chunks/{chunk_id}")
+def chunk_text(chunk_id: str, request: Request):
+    # Full text behind a source id ("scene:4"); ids are only valid
+    # for one index version, which the ETag carries
+    etag = f'"{index_version()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    found = get_chunk(chunk_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Unknown chunk id: {chunk_id}")
+    return json_response(request, found, {"ETag": etag, "Cache-Control": "public, max-age=300"})
+
+# --------------------------------------------------------
+# STREAMING: sources as soon as retrieval is done, then the
+# answer token by token. NDJSON by default, SSE on request.
+# --------------------------------------------------------
+def stream_event(fmt, event, data):
+    if fmt == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+    return orjson.dumps({"type": event, **data}) + b"\n"
+
+@app.post("/query/stream")
+async def ask_question_stream(body: Query, format: str = "ndjson", sources: SourceMode = "full"):
+    fmt = "sse" if format == "sse" else "ndjson"
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+
+    try:
+        key = await cache_key_for(body)
+        cached = response_cache.get(key)
+        if cached is None:
+            raw_sources, filters = await executor.run(retrieve_for, body)
+            # Generation takes its pool slot once the stream starts
+            executor.check()
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly",
+                            headers={"Retry-After": "1"})
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        if cached is not None:
+            yield stream_event(fmt, "sources", {"sources": project_sources(cached["sources"], sources),
+                                                "filters": cached.get("filters", {})})
+            yield stream_event(fmt, "token", {"text": cached["answer"]})
+            yield stream_event(fmt, "done", {"cached": True, "answer_status": cached.get("answer_status")})
+            return
+
+        cleaned = clean_sources(raw_sources)
+        yield stream_event(fmt, "sources", {"sources": project_sources(cleaned, sources), "filters": filters})
+
+        parts, status = [], {}
+        try:
+            async for token in executor.iterate(generate_answer_stream(body.query, raw_sources, status)):
+                parts.append(token)
+                yield stream_event(fmt, "token", {"text": token})
+        except Exception as e:
+            yield stream_event(fmt, "error", {"detail": str(e)})
+            return
+
+        answer_status = status["answer"]
+        if answer_status == "truncated":
+            yield stream_event(fmt, "error", {"detail": "LLM stream broke off, the answer is incomplete"})
+        if answer_status in CACHEABLE_ANSWERS:
+            response_cache.set(key, {"answer": "".join(parts), "answer_status": answer_status,
+                                     "sources": cleaned, "filters": filters})
+        yield stream_event(fmt, "done", {"cached": False, "answer_status": answer_status})
+
+    return StreamingResponse(events(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --------------------------------------------------------
+# BATCH QUERIES: one encode + one vectorized search per chunk
+# --------------------------------------------------------
+def answer_batch(queries, filters=None, auto_filters=None):
+    # Same keys (and result shape) as /query, so the two share entries
+    keys = [response_cache_key(q, filters, auto_filters) for q in queries]
+    results = [response_cache.get(k) for k in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+
+    if missing:
+        computed = rag_pipeline_batch([queries[i] for i in missing], filters, auto_filters)
+        for i, (answer, raw_sources, resolved, answer_status) in zip(missing, computed):
+            results[i] = {
+                "answer": answer,
+                "answer_status": answer_status,
+                "sources": clean_sources(raw_sources),
+                "filters": resolved
+            }
+            if answer_status in CACHEABLE_ANSWERS:
+                response_cache.set(keys[i], results[i])
+
+    return results
+
+async def run_batch(queries, filters=None, auto_filters=None):
+    try:
+        return await executor.run(answer_batch, queries, filters, auto_filters)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly",
+                            headers={"Retry-After": "1"})
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/query/batch")
+async def ask_batch(body: BatchQuery, request: Request, sources: SourceMode = "full"):
+    queries = body.queries
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+
+    if not body.stream:
+        results = await run_batch(queries, body.filter_dict(), body.auto_filters)
+        return json_response(request, {
+            "results": [{"query": q, **shape_result(r, sources)} for q, r in zip(queries, results)]
         })
 
-    cleaned_sources = sorted(cleaned_sources, key=lambda x: x["confidence"], reverse=True)
+    # NDJSON: one line per query, in order, flushed chunk by chunk
+    async def ndjson():
+        for start in range(0, len(queries), BATCH_CHUNK_SIZE):
+            chunk = queries[start:start + BATCH_CHUNK_SIZE]
+            try:
+                results = await run_batch(chunk, body.filter_dict(), body.auto_filters)
+            except HTTPException as e:
+                yield orjson.dumps({"error": e.detail, "index": start}) + b"\n"
+                return
+            for offset, (q, r) in enumerate(zip(chunk, results)):
+                yield orjson.dumps({"index": start + offset, "query": q, **shape_result(r, sources)}) + b"\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
+@app.get("/cache/stats")
+def cache_stats():
     return {
-        "answer": answer,
-        "sources": cleaned_sources
+        "index_version": index_version(),
+        "response_cache": response_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "batcher": batcher.stats() if batcher is not None else None,
+        "reranker": reranker.stats() if reranker is not None else None,
+        "executor": executor.stats(),
+        "llm": llm_stats(),
     }
 
+# Benchmarks (evaluate/benchmark.py) start every level cold. Caches
+# are per worker: this clears the one that answers. Disabled unless
+# ADMIN_TOKEN is set; callers send it as X-Admin-Token.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+@app.post("/cache/clear")
+def cache_clear(request: Request):
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    response_cache.clear()
+    embedding_cache.clear()
+    if semantic_cache is not None:
+        semantic_cache.clear()
+    if reranker is not None:
+        reranker.clear()
+    return {"status": "cleared", "pid": os.getpid()}
+
 @app.get("/test")
 def test():
     return {"status": "backend alive"}
+
+@app.get("/ready")
+def ready(response: Response):
+    if not is_ready():
+        response.status_code = 503
+        return {"status": "warming up", "startup": startup_timings}
+    return {"status": "ready", "startup": startup_timings}
@@ -0,0 +1,194 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# --------------------------------------------------------
+# Minimal Prometheus-style metrics (text exposition 0.0.4).
+# Counters, gauges and histograms with optional labels, plus
+# callback metrics sampled at scrape time.
+# --------------------------------------------------------
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+def _fmt(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[n] for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        lines = self.header()
+        for key, v in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {_fmt(v)}")
+        return lines
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    render = Counter.render
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self):
+        lines = self.header()
+        names = self.labelnames + ("le",)
+        for key, (counts, total, n) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_label_str(names, key + (_fmt(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {n}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    # fn() -> list of (label_values_tuple, value), sampled at scrape time
+    def __init__(self, name, help, type, fn, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.fn = fn
+
+    def render(self):
+        lines = self.header()
+        for key, v in self.fn():
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {_fmt(v)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, type, fn, labelnames=()):
+        return self.register(CallbackMetric(name, help, type, fn, labelnames))
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------------
+# Shared registry + the metrics every module records into
+# --------------------------------------------------------
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time spent per pipeline stage", ["stage"]
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_request_seconds", "End-to-end request latency", ["endpoint"]
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "rag_requests_total", "Requests served", ["endpoint", "status"]
+)
+ERRORS_TOTAL = REGISTRY.counter(
+    "rag_errors_total", "Requests that failed with an exception or 5xx", ["endpoint"]
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "rag_in_flight_requests", "Requests currently being handled"
+)
@@ -0,0 +1,55 @@
+# ===============================================================
+# Build-time step: bake the embedding model (and, with RERANK=1,
+# the cross-encoder) and the memory-mapped embedding store into
+# the image so startup is offline and bounded.
+#
+#   python prebake.py      (run from backend/, see Dockerfile)
+# ===============================================================
+
+import os
+import time
+
+from embedders import load_embedder
+from rag import (
+    EMBED_BACKEND,
+    EMBED_MODEL,
+    ONNX_DIR,
+    EMBEDDING_STORE_PATH,
+    RERANK_MODEL,
+    load_chroma_collections,
+    read_manifest_version,
+    reranker,
+)
+from vector_index import FusedIndex
+
+EMBED_STORE_DTYPE = os.getenv("EMBED_STORE_DTYPE", "float32")   # float32 | float16
+
+
+def main():
+    t0 = time.perf_counter()
+    if FusedIndex.exists(EMBEDDING_STORE_PATH):
+        # Already produced by indexing/build_chromadb.py
+        index = FusedIndex.load(EMBEDDING_STORE_PATH)
+        print(f"✅ Embedding store present: {len(index)} rows, version {index.fingerprint()}")
+    else:
+        print(f"🔹 Building embedding store at {EMBEDDING_STORE_PATH}...")
+        index = FusedIndex.from_chroma(load_chroma_collections(), version=read_manifest_version())
+        index.save(EMBEDDING_STORE_PATH, dtype=EMBED_STORE_DTYPE)
+        print(f"✅ {len(index)} rows, version {index.fingerprint()} "
+              f"({time.perf_counter() - t0:.1f}s)")
+
+    t0 = time.perf_counter()
+    print(f"🔹 Fetching embedding model ({EMBED_BACKEND})...")
+    embedder = load_embedder(EMBED_BACKEND, EMBED_MODEL, onnx_dir=ONNX_DIR)
+    embedder.encode(["warm up"])
+    print(f"✅ Model cached ({time.perf_counter() - t0:.1f}s)")
+
+    if reranker is not None:
+        t0 = time.perf_counter()
+        print(f"🔹 Fetching re-ranker ({RERANK_MODEL})...")
+        reranker.get_model().predict([("warm up", "warm up")])
+        print(f"✅ Re-ranker cached ({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
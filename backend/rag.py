@@ -1,28 +1,51 @@
-import chromadb
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from batching import MicroBatcher
+from diversify import diversify
+from embedders import load_embedder
+from embedding_cache import EmbeddingCache
+from filters import FILTER_KEYS, UnsupportedFilter, extract_filters
+from hierarchy import Hierarchy
+from lexical import LexicalIndex, fuse_scores
+from llm import LLMRunner, LLMTruncated, LLMUnavailable, build_context, load_provider
+from metrics import STAGE_SECONDS
+from reranker import CrossEncoderReranker
+from response_cache import InMemoryLRUBackend, ResponseCache
+from semantic_cache import SemanticCache
+from vector_index import FusedIndex
 
 # --------------------------------------------------------
 # TEST MODE (LLM is disabled) ok
 # --------------------------------------------------------
-TEST_MODE = True
+TEST_MODE = os.getenv("TEST_MODE", "1") == "1"
 
 TOP_K = 2
 
 # Path to chroma folder INSIDE backend/
 CHROMA_PATH = "./chroma_julius_caesar"
 
-# --------------------------------------------------------
-# Load Chroma Persistent Client
-# --------------------------------------------------------
-client = chromadb.PersistentClient(path=CHROMA_PATH)
+# Memory-mapped embedding store (written by indexing/build_chromadb.py,
+# or by prebake.py when missing); when present, startup never opens Chroma
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", os.path.join(CHROMA_PATH, "embedding_store"))
 
-collections = {
-    "scene":        client.get_collection("julius_caesar_scene"),
-    "explanation":  client.get_collection("julius_caesar_explanation"),
-    "context":      client.get_collection("julius_caesar_context"),
-    "speaker":      client.get_collection("julius_caesar_speaker")
-}
+# Lexical (BM25) index persisted next to the Chroma store by
+# indexing/build_lexical.py, fused with dense scores per query
+LEXICAL_PATH = os.getenv("LEXICAL_PATH", os.path.join(CHROMA_PATH, "lexical_index.npz"))
+HYBRID_MODE = os.getenv("HYBRID_MODE", "weighted")     # weighted | rrf | off
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.3"))
+
+# flat:         every collection's vectors are searched
+# hierarchical: only speaker vectors are searched; windows, scenes
+#               and explanations score as the max (or mean) of the
+#               speaker chunks they cover
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "flat")
+HIER_AGG = os.getenv("HIER_AGG", "max")
 
 # Retrieval weights for ranking
 COLLECTION_WEIGHTS = {
@@ -32,8 +55,223 @@ COLLECTION_WEIGHTS = {
     "speaker":      1.00
 }
 
-# Embedding model
-embedder = SentenceTransformer("BAAI/bge-base-en-v1.5")
+# --------------------------------------------------------
+# Embedding model: torch (default), onnx or onnx-int8.
+# Intra-op threads are pinned so the request pool and the
+# model don't oversubscribe the cores.
+# --------------------------------------------------------
+EMBED_MODEL = "BAAI/bge-base-en-v1.5"
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+ONNX_DIR = os.getenv("ONNX_DIR", "./onnx_bge")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", os.getenv("TORCH_THREADS", str(os.cpu_count() or 1))))
+
+WARMUP_QUERY = "What does the Soothsayer say to Caesar?"
+
+# --------------------------------------------------------
+# LIFECYCLE: index and model load lazily (first use) or via
+# warm_up(); is_ready() only passes after both are loaded and
+# a warm-up query has gone through the whole retrieval path.
+# --------------------------------------------------------
+_index = None
+_hierarchy = None
+_embedder = None
+_lexical = None
+_index_lock = threading.Lock()
+_embedder_lock = threading.Lock()
+_lexical_lock = threading.Lock()
+_ready = threading.Event()
+
+startup_timings = {}   # phase -> ms
+
+def _timed(phase, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    startup_timings[phase] = round((time.perf_counter() - t0) * 1000, 1)
+    return result
+
+def load_chroma_collections():
+    import chromadb
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return {
+        "scene":        client.get_collection("julius_caesar_scene"),
+        "explanation":  client.get_collection("julius_caesar_explanation"),
+        "context":      client.get_collection("julius_caesar_context"),
+        "speaker":      client.get_collection("julius_caesar_speaker")
+    }
+
+def read_manifest_version():
+    # Written by indexing/build_chromadb.py on every (incremental) build
+    path = os.path.join(CHROMA_PATH, "index_manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("version")
+
+def build_index():
+    # Fused in-memory index (Chroma stays the persistence layer,
+    # queries never touch it)
+    version = read_manifest_version()
+    if FusedIndex.exists(EMBEDDING_STORE_PATH):
+        index = FusedIndex.load(EMBEDDING_STORE_PATH)
+        if version is None or index.fingerprint() == version:
+            return index
+        print(f"⚠️ Embedding store {index.fingerprint()} is stale (index {version}), reading Chroma")
+    return FusedIndex.from_chroma(load_chroma_collections(), version=version)
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _timed("index", build_index)
+                missing = [k for k in FILTER_KEYS if not _index.has_partition(k)]
+                if missing:
+                    print(f"⚠️ Index has no {'/'.join(missing)} metadata: explicit filters on it are "
+                          f"rejected, auto-extracted ones skipped (rebuild with indexing/build_chromadb.py)")
+    return _index
+
+def get_hierarchy():
+    global _hierarchy
+    if _hierarchy is None:
+        index = get_index()
+        with _index_lock:
+            if _hierarchy is None:
+                _hierarchy = _timed("hierarchy", lambda: Hierarchy(index, agg=HIER_AGG))
+    return _hierarchy
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = _timed("model", lambda: load_embedder(
+                    EMBED_BACKEND, EMBED_MODEL, onnx_dir=ONNX_DIR, threads=EMBED_THREADS
+                ))
+    return _embedder
+
+def load_lexical():
+    if HYBRID_MODE == "off" or not os.path.exists(LEXICAL_PATH):
+        if HYBRID_MODE != "off":
+            print(f"⚠️ No lexical index at {LEXICAL_PATH}, dense-only retrieval")
+        return (None, None)
+
+    lexical = LexicalIndex.load(LEXICAL_PATH)
+    # Column i of the aligned scores belongs to fused-index row i
+    return (lexical, lexical.alignment(get_index().row_keys()))
+
+def get_lexical():
+    global _lexical
+    if _lexical is None:
+        with _lexical_lock:
+            if _lexical is None:
+                _lexical = _timed("lexical", load_lexical)
+    return _lexical
+
+def index_version():
+    lexical, _ = get_lexical()
+    dense = get_index().fingerprint()
+    return f"{dense}+{lexical.version}" if lexical is not None else dense
+
+# Pre-fork serving (serve.py): load the read-only state once in the
+# parent so workers share it copy-on-write. No inference runs here;
+# each worker's own warm_up() starts its thread pools after fork.
+def preload():
+    get_index()
+    get_hierarchy()
+    get_lexical()
+    # ONNX Runtime sessions own native thread pools that don't survive
+    # fork(), so those backends load per worker
+    if EMBED_BACKEND == "torch":
+        get_embedder()
+        if reranker is not None:
+            reranker.get_model()
+
+def warm_up():
+    t0 = time.perf_counter()
+    try:
+        get_index()
+        get_hierarchy()
+        get_lexical()
+        get_embedder()
+        # Encode directly so the warm-up query doesn't land in the cache stats
+        results = _timed("warmup_query", lambda: search_vectors(
+            [WARMUP_QUERY], encode_queries([WARMUP_QUERY]), FETCH_K
+        ))
+        if reranker is not None:
+            # Also calibrates the per-pair cost the budget relies on
+            _timed("reranker", lambda: reranker.rerank(
+                WARMUP_QUERY, results[0], TOP_K, version="warm-up"
+            ))
+    except Exception as e:
+        startup_timings["error"] = str(e)
+        raise
+
+    startup_timings["total"] = round((time.perf_counter() - t0) * 1000, 1)
+    print(f"✅ Backend ready: {startup_timings}")
+    _ready.set()
+
+def is_ready():
+    return _ready.is_set()
+
+# --------------------------------------------------------
+# Query-embedding cache (shared by single and batch paths)
+# --------------------------------------------------------
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "0")) or None
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH") or None   # e.g. ./cache/query_embeddings
+
+# Vectors differ per backend, so each backend gets its own disk shard
+embedding_cache = EmbeddingCache(
+    max_size=EMBED_CACHE_SIZE,
+    ttl=EMBED_CACHE_TTL,
+    disk_path=f"{EMBED_CACHE_PATH}.{EMBED_BACKEND}" if EMBED_CACHE_PATH else None,
+)
+
+# --------------------------------------------------------
+# Full-response cache (used by the API layer)
+# --------------------------------------------------------
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "0")) or None
+
+response_cache = ResponseCache(
+    InMemoryLRUBackend(max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+)
+
+# --------------------------------------------------------
+# Semantic cache: search results (and generated answers) for
+# paraphrases of recent queries, matched on embedding cosine.
+# Scoped by k + filters (answers: by the exact sources), reset
+# whenever the index version changes. 0 disables it.
+# --------------------------------------------------------
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_NEAR_MISS = float(os.getenv("SEMANTIC_NEAR_MISS", "0.90"))
+
+semantic_cache = SemanticCache(
+    max_size=SEMANTIC_CACHE_SIZE,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    near_miss=SEMANTIC_NEAR_MISS,
+) if SEMANTIC_CACHE_SIZE > 0 else None
+
+def search_scope(k, filters=None):
+    return json.dumps(["search", k, sorted((filters or {}).items())])
+
+def answer_scope(chunks):
+    return json.dumps(["answer", [c["row"] for c in chunks]])
+
+def response_cache_key(query, filters=None, auto_filters=None):
+    return ResponseCache.make_key(
+        query, TOP_K, COLLECTION_WEIGHTS, index_version(),
+        test_mode=TEST_MODE, embed=EMBED_BACKEND,
+        llm="off" if TEST_MODE else f"{LLM_PROVIDER}:{LLM_MODEL}:{LLM_CONTEXT_TOKENS}",
+        hybrid=f"{HYBRID_MODE}:{HYBRID_ALPHA}",
+        retrieval=f"{RETRIEVAL_MODE}:{HIER_AGG}",
+        diversify=f"{MMR_LAMBDA}:{DEDUP_OVERLAP}:{MMR_K}" if DIVERSIFY else "off",
+        rerank=f"{RERANK_MODEL}:{RERANK_FETCH_K}" if reranker is not None else "off",
+        filters=sorted((filters or {}).items()),
+        auto_filters=AUTO_FILTERS if auto_filters is None else auto_filters,
+    )
 
 # --------------------------------------------------------
 # Vector normalization
@@ -43,52 +281,331 @@ def normalize(v):
     n = np.linalg.norm(v)
     return v / n if n > 0 else v
 
+# --------------------------------------------------------
+# Query embedding (cached)
+# --------------------------------------------------------
+def encode_queries(queries):
+    embedder = get_embedder()
+    with STAGE_SECONDS.time(stage="embed"):
+        return embedder.encode(queries)
+
+def embed_queries(queries):
+    return embedding_cache.get_many(queries, encode_queries)
+
+def embed_query(query):
+    return embed_queries([query])[0]
+
 # --------------------------------------------------------
 # RETRIEVAL: Weighted ranking across collections
 # --------------------------------------------------------
-def retrieve_top_k(query, k=TOP_K):
-    q_vec = normalize(embedder.encode(query)).tolist()
-    results = []
+def lexical_scores(queries):
+    lexical, align = get_lexical()
+    if lexical is None:
+        return None
 
-    for name in ["scene", "explanation", "context", "speaker"]:
-        coll = collections[name]
-        res = coll.query(query_embeddings=[q_vec], n_results=k)
+    with STAGE_SECONDS.time(stage="lexical"):
+        scores = lexical.score_batch(queries)
+        aligned = np.zeros((len(queries), len(align)), dtype=np.float32)
+        hit = align >= 0
+        aligned[:, hit] = scores[:, align[hit]]
+    return aligned
 
-        docs = res["documents"][0]
-        metas = res["metadatas"][0]
-        distances = res["distances"][0]
-        weight = COLLECTION_WEIGHTS[name]
+def search_vectors(queries, q_vecs, k=TOP_K, rows=None):
+    index = get_index()
+    lex = lexical_scores(queries)
+    fuse = None
+    if lex is not None:
+        if rows is not None:
+            lex = lex[:, rows]
+        fuse = lambda dense: fuse_scores(dense, lex, alpha=HYBRID_ALPHA, mode=HYBRID_MODE)
 
-        for doc, meta, dist in zip(docs, metas, distances):
-            base_conf = 1 / (1 + dist)
-            final_conf = base_conf * weight
+    hierarchy = get_hierarchy() if RETRIEVAL_MODE == "hierarchical" else None
+    with STAGE_SECONDS.time(stage="search"):
+        return index.search_batch(q_vecs, k, COLLECTION_WEIGHTS, fuse=fuse, rows=rows, hierarchy=hierarchy)
 
-            results.append({
-                "collection": name,
-                "chunk": doc,
-                "metadata": meta,
-                "confidence": float(final_conf),
-            })
+def cached_search(queries, q_vecs, k=TOP_K, filters=None, rows=None):
+    if semantic_cache is None:
+        return search_vectors(queries, q_vecs, k, rows=rows)
 
-    results = sorted(results, key=lambda x: x["confidence"], reverse=True)
+    scope, version = search_scope(k, filters), index_version()
+    results = semantic_cache.get_many(q_vecs, scope, version)
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        fresh = search_vectors([queries[i] for i in missing], q_vecs[missing], k, rows=rows)
+        for i, res in zip(missing, fresh):
+            results[i] = res
+            semantic_cache.put(q_vecs[i], scope, version, res)
     return results
 
+def retrieve_batch(queries, k=TOP_K):
+    return cached_search(queries, embed_queries(queries), k)
+
+# --------------------------------------------------------
+# RE-RANKING (optional): over-fetch RERANK_FETCH_K per
+# collection, re-score the candidates with a cross-encoder
+# within RERANK_BUDGET_MS (counted from the start of the
+# request's retrieval), return TOP_K x collections of them
+# --------------------------------------------------------
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "5"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+
+reranker = CrossEncoderReranker(
+    RERANK_MODEL,
+    max_length=RERANK_MAX_LENGTH,
+    threads=EMBED_THREADS,
+) if RERANK else None
+
+# Per-collection k the first stage fetches
+FETCH_K = max(TOP_K, RERANK_FETCH_K) if reranker is not None else TOP_K
+
+def rerank_results(query, candidates, k=TOP_K, t_start=None):
+    if reranker is None:
+        return candidates
+
+    budget = RERANK_BUDGET_MS
+    if t_start is not None:
+        budget -= (time.perf_counter() - t_start) * 1000
+    with STAGE_SECONDS.time(stage="rerank"):
+        return reranker.rerank(query, candidates, k * len(COLLECTION_WEIGHTS),
+                               budget_ms=budget, version=index_version())
+
+# --------------------------------------------------------
+# DIVERSIFICATION of the final results: span-overlap dedup
+# (a window, the speaker line inside it and their scene carry
+# the same text) followed by MMR. MMR_K caps the sources
+# returned (0 keeps every survivor).
+# --------------------------------------------------------
+DIVERSIFY = os.getenv("DIVERSIFY", "1") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+DEDUP_OVERLAP = float(os.getenv("DEDUP_OVERLAP", "0.5"))
+MMR_K = int(os.getenv("MMR_K", "0"))
+
+def diversify_results(chunks):
+    if not DIVERSIFY or len(chunks) < 2:
+        return chunks
+    with STAGE_SECONDS.time(stage="diversify"):
+        return diversify(chunks, get_index(), get_hierarchy(), k=MMR_K or None,
+                         lam=MMR_LAMBDA, max_overlap=DEDUP_OVERLAP)
+
+# Concurrent requests are coalesced into one encode + one search
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+
+batcher = MicroBatcher(
+    lambda queries: retrieve_batch(queries, FETCH_K),
+    window_ms=BATCH_WINDOW_MS,
+    max_batch=BATCH_MAX_SIZE,
+) if BATCH_WINDOW_MS > 0 else None
+
+# --------------------------------------------------------
+# METADATA FILTERS (act / scene / speaker / type). Explicit
+# filters are strict; filters auto-extracted from the query
+# text are dropped if they would leave nothing to search.
 # --------------------------------------------------------
-# TEST-MODE Answer Generator (NO LLM)
+AUTO_FILTERS = os.getenv("AUTO_FILTERS", "1") == "1"
+
+def resolve_filters(query, filters=None, auto_filters=None):
+    # auto_filters=None follows the AUTO_FILTERS switch
+    explicit = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    index = get_index()
+    unsupported = [k for k in explicit if not index.has_partition(k)]
+    if unsupported:
+        raise UnsupportedFilter(f"This index has no {'/'.join(unsupported)} metadata to filter on")
+    if not (AUTO_FILTERS if auto_filters is None else auto_filters):
+        return explicit
+
+    extracted = extract_filters(query, index.partition_values("speaker"))
+    extracted = {k: v for k, v in extracted.items() if index.has_partition(k)}
+    merged = {**extracted, **explicit}
+    if extracted and len(index.filter_rows(merged)) == 0:
+        return explicit
+    return merged
+
+def retrieve_filtered(query, filters, k=TOP_K):
+    with STAGE_SECONDS.time(stage="filter"):
+        rows = get_index().filter_rows(filters)
+    if len(rows) == 0:
+        return []
+    return cached_search([query], embed_queries([query]), k, filters=filters, rows=rows)[0]
+
+def retrieve_candidates(query, k, filters=None):
+    if filters:
+        return retrieve_filtered(query, filters, k)
+    if batcher is not None and k == FETCH_K:
+        return batcher.run(query)
+    return retrieve_batch([query], k)[0]
+
+def get_chunk(key):
+    index = get_index()
+    row = index.row_for_key(key)
+    if row is None:
+        return None
+    return {"id": key, "collection": index.names[index.coll_ids[row]],
+            "text": index.doc(row), **index.meta(row)}
+
+def retrieve_top_k(query, k=TOP_K, filters=None):
+    t0 = time.perf_counter()
+    if reranker is None:
+        return diversify_results(retrieve_candidates(query, k, filters))
+    candidates = retrieve_candidates(query, max(k, RERANK_FETCH_K), filters)
+    return diversify_results(rerank_results(query, candidates, k, t_start=t0))
+
 # --------------------------------------------------------
-def generate_answer(query, chunks):
+# LLM generation (used when TEST_MODE is off). Providers:
+# gemini (REST) or openai (any /chat/completions server,
+# e.g. vLLM or a local mock via LLM_BASE_URL). One pooled
+# async client serves every request; on a timeout or error
+# before the first token the extractive answer is streamed
+# instead.
+# --------------------------------------------------------
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))            # generations in flight
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))                 # whole answer, seconds
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "5"))
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "1500"))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "512"))
+
+SYSTEM_PROMPT = """You are a Shakespearean scholar answering questions about *Julius Caesar*.
+Use ONLY the context passages below. Do not invent facts.
+Cite Act and Scene for every claim, e.g. (Act 3, Scene 2).
+Keep a scholarly, concise tone."""
+
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                provider = load_provider(
+                    LLM_PROVIDER, LLM_MODEL,
+                    api_key=os.getenv("LLM_API_KEY") or os.getenv("GEMINI_API_KEY"),
+                    base_url=LLM_BASE_URL,
+                    max_output_tokens=LLM_MAX_OUTPUT_TOKENS,
+                )
+                _llm = LLMRunner(
+                    provider,
+                    concurrency=LLM_CONCURRENCY,
+                    timeout=LLM_TIMEOUT,
+                    first_token_timeout=LLM_FIRST_TOKEN_TIMEOUT,
+                    max_connections=LLM_CONCURRENCY * 2,
+                )
+    return _llm
+
+def close_llm():
+    if _llm is not None:
+        _llm.close()
+
+def llm_stats():
+    if _llm is None:
+        return {"provider": "off" if TEST_MODE else LLM_PROVIDER}
+    return _llm.stats()
+
+def build_prompt(query, chunks):
+    context = build_context(chunks, LLM_CONTEXT_TOKENS)
+    return f"Context:\n{context}\n\nQuestion: {query}\nAnswer:"
+
+# --------------------------------------------------------
+# Answer Generator (streaming). TEST MODE: no LLM, the
+# extractive summary is streamed word by word; it is also
+# the fallback when the LLM is unavailable.
+# `status["answer"]` records where the answer came from:
+#   extractive      test mode / no context (final)
+#   llm             generated in full (final)
+#   semantic_cache  a cached generation (final)
+#   fallback        LLM unavailable, extractive instead
+#   truncated       the LLM stream broke off mid-answer
+# Only final answers may be cached.
+# --------------------------------------------------------
+CACHEABLE_ANSWERS = {"extractive", "llm", "semantic_cache"}
+
+def extractive_answer(chunks, label):
     if chunks:
-        top = chunks[0]["chunk"]
-        return f"Context-based summary (test mode): {top[:250]}..."
-    else:
-        return "No relevant context found (test mode)."
+        return f"Context-based summary ({label}): {chunks[0]['chunk'][:250]}..."
+    return f"No relevant context found ({label})."
+
+def stream_words(text):
+    words = text.split(" ")
+    for i, w in enumerate(words):
+        yield w if i == len(words) - 1 else w + " "
+
+def generate_answer_stream(query, chunks, status=None):
+    status = {} if status is None else status
+    status["answer"] = "extractive"
+    if TEST_MODE:
+        yield from stream_words(extractive_answer(chunks, "test mode"))
+        return
+
+    if not chunks:
+        yield from stream_words(extractive_answer(chunks, "no context"))
+        return
+
+    if semantic_cache is not None:
+        q_vec, scope, version = embed_query(query), answer_scope(chunks), index_version()
+        cached = semantic_cache.get(q_vec, scope, version)
+        if cached is not None:
+            status["answer"] = "semantic_cache"
+            yield cached
+            return
+
+    parts = []
+    status["answer"] = "llm"
+    try:
+        for piece in get_llm().stream(SYSTEM_PROMPT, build_prompt(query, chunks)):
+            parts.append(piece)
+            yield piece
+    except LLMUnavailable as e:
+        print(f"⚠️ LLM unavailable, falling back to extractive answer: {e}")
+        status["answer"] = "fallback"
+        yield from stream_words(extractive_answer(chunks, "LLM unavailable"))
+        return
+    except LLMTruncated as e:
+        print(f"⚠️ LLM stream broke off mid-answer: {e}")
+        status["answer"] = "truncated"
+        return
+
+    # The runner finished cleanly: the whole answer was streamed
+    if semantic_cache is not None and parts:
+        semantic_cache.put(q_vec, scope, version, "".join(parts))
+
+def generate_answer(query, chunks, status=None):
+    return "".join(generate_answer_stream(query, chunks, status))
 
 # --------------------------------------------------------
 # FULL RAG PIPELINE
 # --------------------------------------------------------
-def rag_pipeline(query):
-    chunks = retrieve_top_k(query)
+def rag_pipeline(query, filters=None, auto_filters=None):
+    chunks = retrieve_top_k(query, filters=resolve_filters(query, filters, auto_filters))
     answer = generate_answer(query, chunks)
     return answer, chunks
 
+def rag_pipeline_batch(queries, filters=None, auto_filters=None):
+    # Unscoped queries share one vectorized search; scoped ones
+    # each scan their own slice. `filters` apply to every query.
+    filters = [resolve_filters(q, filters, auto_filters) for q in queries]
+    plain = [i for i, f in enumerate(filters) if not f]
+
+    all_chunks = [None] * len(queries)
+    for i, chunks in zip(plain, retrieve_batch([queries[i] for i in plain], FETCH_K) if plain else []):
+        all_chunks[i] = chunks
+    for i, f in enumerate(filters):
+        if f:
+            all_chunks[i] = retrieve_filtered(queries[i], f, FETCH_K)
+    all_chunks = [diversify_results(rerank_results(q, chunks)) for q, chunks in zip(queries, all_chunks)]
+
+    statuses = [{} for _ in queries]
+    if TEST_MODE or len(queries) < 2:
+        answers = [generate_answer(*args) for args in zip(queries, all_chunks, statuses)]
+    else:
+        # Generations overlap; the LLM runner caps how many are in flight
+        with ThreadPoolExecutor(max_workers=min(LLM_CONCURRENCY, len(queries))) as pool:
+            answers = list(pool.map(generate_answer, queries, all_chunks, statuses))
+    return list(zip(answers, all_chunks, filters, [s["answer"] for s in statuses]))
+
 # print(rag_pipeline("What are the main themes in Julius Caesar?"))
\ No newline at end of file
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_cache import normalize_query
+
+
+# --------------------------------------------------------
+# CROSS-ENCODER RE-RANKER
+#   - scores (query, chunk) pairs for the over-fetched
+#     candidates in one predict() call
+#   - LRU cache of pair scores, cleared when the index
+#     version changes
+#   - latency budget: the measured cost per pair (EWMA) caps
+#     how many uncached pairs are scored; the best first-stage
+#     candidates that fit are re-ranked, the rest keep their
+#     order behind them. Too few fit -> re-ranking is skipped.
+# --------------------------------------------------------
+class CrossEncoderReranker:
+    def __init__(self, model_name, max_length=256, threads=None, cache_size=8192, min_candidates=2):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.threads = threads
+        self.cache_size = cache_size
+        self.min_candidates = min_candidates
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()     # (query, row key) -> score
+        self._cache_lock = threading.Lock()
+        self._version = None
+
+        self.ms_per_pair = None
+        self.calls = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.truncated = 0
+        self.skipped = 0
+
+    def get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    if self.threads:
+                        import torch
+                        torch.set_num_threads(self.threads)
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self._model
+
+    @staticmethod
+    def pair_key(query, c):
+        return (normalize_query(query), f"{c['collection']}:{c['id']}")
+
+    def _lookup(self, keys, version):
+        with self._cache_lock:
+            if version != self._version:
+                self._cache.clear()
+                self._version = version
+            scores = []
+            for key in keys:
+                s = self._cache.get(key)
+                if s is not None:
+                    self._cache.move_to_end(key)
+                scores.append(s)
+            return scores
+
+    def _store(self, items):
+        with self._cache_lock:
+            for key, score in items:
+                self._cache[key] = score
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, query, chunks):
+        t0 = time.perf_counter()
+        scores = self.get_model().predict([(query, c["chunk"]) for c in chunks], batch_size=len(chunks))
+        ms = (time.perf_counter() - t0) * 1000 / len(chunks)
+        self.ms_per_pair = ms if self.ms_per_pair is None else 0.8 * self.ms_per_pair + 0.2 * ms
+        self.pairs_scored += len(chunks)
+        return np.asarray(scores, dtype=np.float32)
+
+    def rerank(self, query, candidates, top_n, budget_ms=None, version=None):
+        self.calls += 1
+        if not candidates:
+            return []
+
+        keys = [self.pair_key(query, c) for c in candidates]
+        cached = self._lookup(keys, version)
+
+        # Largest first-stage prefix whose uncached pairs fit the budget
+        n = len(candidates)
+        if budget_ms is not None and self.ms_per_pair:
+            affordable = int(budget_ms / self.ms_per_pair)
+            misses = np.cumsum([s is None for s in cached])
+            n = int(np.searchsorted(misses, affordable, side="right"))
+            if n < len(candidates):
+                self.truncated += 1
+        if n < self.min_candidates:
+            self.skipped += 1
+            return candidates[:top_n]
+
+        head, scores = candidates[:n], cached[:n]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        self.cache_hits += n - len(missing)
+        if missing:
+            fresh = self.score(query, [head[i] for i in missing])
+            self._store((keys[i], float(s)) for i, s in zip(missing, fresh))
+            for i, s in zip(missing, fresh):
+                scores[i] = float(s)
+
+        order = np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")
+        ranked = [{**head[i], "rerank_score": scores[i]} for i in order]
+        return (ranked + candidates[n:])[:top_n]
+
+    def clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "pairs_scored": self.pairs_scored,
+            "cache_hits": self.cache_hits,
+            "cache_size": len(self._cache),
+            "truncated": self.truncated,
+            "skipped": self.skipped,
+            "ms_per_pair": round(self.ms_per_pair, 3) if self.ms_per_pair else None,
+        }
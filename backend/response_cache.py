@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from embedding_cache import normalize_query
+
+
+# --------------------------------------------------------
+# BACKEND INTERFACE
+# Anything with get/set/clear/__len__ can sit behind the
+# response cache (e.g. a Redis or local-disk stand-in).
+# --------------------------------------------------------
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key):
+        ...
+
+    @abstractmethod
+    def set(self, key, value):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+
+# --------------------------------------------------------
+# In-process LRU backend
+# --------------------------------------------------------
+class InMemoryLRUBackend(CacheBackend):
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (value, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# --------------------------------------------------------
+# RESPONSE CACHE
+# Key = normalized query + retrieval config + index version,
+# so a rebuilt index never serves stale answers.
+# --------------------------------------------------------
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else InMemoryLRUBackend()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query, top_k, weights, index_version, **extra):
+        payload = json.dumps({
+            "q": normalize_query(query),
+            "k": top_k,
+            "w": sorted(weights.items()),
+            "v": index_version,
+            "x": sorted(extra.items()),
+        }, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.backend),
+            "max_size": getattr(self.backend, "max_size", None),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
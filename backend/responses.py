@@ -0,0 +1,84 @@
+import gzip
+import os
+
+import orjson
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:     # optional: gzip only
+    brotli = None
+
+# --------------------------------------------------------
+# SOURCE SHAPES
+# Sources are shaped once (full text + a stable "collection:id"
+# chunk id) and stored that way in the response cache; each
+# request then projects them to the mode it asked for:
+#   full     text as today
+#   snippet  first SNIPPET_CHARS characters, full text via
+#            GET /chunks/{id}
+#   ids      no text at all
+# --------------------------------------------------------
+SNIPPET_CHARS = int(os.getenv("SNIPPET_CHARS", "200"))
+
+
+def snippet(text):
+    if len(text) <= SNIPPET_CHARS:
+        return text
+    return text[:SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+
+
+def project_sources(sources, mode):
+    if mode == "full":
+        return sources
+    out = []
+    for s in sources:
+        shaped = {k: v for k, v in s.items() if k != "text"}
+        if mode == "snippet":
+            shaped["snippet"] = snippet(s["text"])
+        out.append(shaped)
+    return out
+
+
+# --------------------------------------------------------
+# ENCODING: orjson, then br / gzip when the client accepts
+# it and the body is big enough to be worth it
+# --------------------------------------------------------
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def negotiate_encoding(accept_encoding):
+    offered = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name] = q
+
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def json_response(request, payload, headers=None):
+    body = orjson.dumps(payload)
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type="application/json", headers=headers)
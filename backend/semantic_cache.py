@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+
+
+# --------------------------------------------------------
+# SEMANTIC CACHE
+# Paraphrased queries ("What does the soothsayer tell Caesar"
+# vs "What does the Soothsayer say to Caesar?") miss every
+# exact-string cache. Entries here are (query embedding,
+# scope, value) in a fixed-size contiguous matrix; a lookup
+# is one matmul against it, and a hit needs cosine >= threshold
+# within the same scope (e.g. k + filters).
+#   - LRU eviction once every slot is taken
+#   - the whole cache resets when the index version changes
+#   - near misses (threshold > cosine >= near_miss) are counted
+#     so the threshold can be tuned from /cache/stats
+# --------------------------------------------------------
+class SemanticCache:
+    def __init__(self, max_size=512, threshold=0.95, near_miss=0.90):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.near_miss = near_miss
+
+        self._lock = threading.Lock()
+        self.version = None
+        self.hits = 0
+        self.near_misses = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._hit_sim_sum = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.matrix = None                                   # (max_size, dim), allocated on first put
+        self.scopes = np.full(self.max_size, -1, dtype=np.int32)   # -1 = free slot
+        self.last_used = np.zeros(self.max_size, dtype=np.int64)
+        self.values = [None] * self.max_size
+        self._scope_ids = {}
+        self._tick = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.version is not None and (self.scopes >= 0).any():
+                self.invalidations += 1
+            self._reset()
+            self.version = version
+
+    def __len__(self):
+        return int((self.scopes >= 0).sum())
+
+    @staticmethod
+    def _unit(vecs):
+        v = np.asarray(vecs, dtype=np.float32)
+        v = v[None, :] if v.ndim == 1 else v
+        n = np.linalg.norm(v, axis=1, keepdims=True)
+        return np.divide(v, n, out=np.zeros_like(v), where=n > 0)
+
+    def get_many(self, vecs, scope, version):
+        v = self._unit(vecs)
+        out = [None] * len(v)
+
+        with self._lock:
+            self._check_version(version)
+            sid = self._scope_ids.get(scope)
+            if sid is None or self.matrix is None:
+                self.misses += len(v)
+                return out
+
+            sims = v @ self.matrix.T
+            sims[:, self.scopes != sid] = -np.inf
+            best = sims.argmax(axis=1)
+            best_sim = sims[np.arange(len(v)), best]
+
+            for i, (slot, sim) in enumerate(zip(best.tolist(), best_sim.tolist())):
+                if sim >= self.threshold:
+                    self._tick += 1
+                    self.last_used[slot] = self._tick
+                    self.hits += 1
+                    self._hit_sim_sum += sim
+                    out[i] = self.values[slot]
+                else:
+                    self.misses += 1
+                    if sim >= self.near_miss:
+                        self.near_misses += 1
+        return out
+
+    def get(self, vec, scope, version):
+        return self.get_many([vec], scope, version)[0]
+
+    def put(self, vec, scope, version, value):
+        v = self._unit(vec)[0]
+
+        with self._lock:
+            self._check_version(version)
+            if self.matrix is None:
+                self.matrix = np.zeros((self.max_size, len(v)), dtype=np.float32)
+            sid = self._scope_ids.setdefault(scope, len(self._scope_ids))
+
+            free = np.flatnonzero(self.scopes < 0)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(self.last_used.argmin())
+                self.evictions += 1
+
+            self._tick += 1
+            self.matrix[slot] = v
+            self.scopes[slot] = sid
+            self.last_used[slot] = self._tick
+            self.values[slot] = value
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "near_misses": self.near_misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "mean_hit_similarity": round(self._hit_sim_sum / self.hits, 4) if self.hits else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,117 @@
+# ===============================================================
+# Pre-fork server: the parent loads the embedding store, lexical
+# index and (torch) model once, then forks SERVE_WORKERS uvicorn
+# workers that share one listening socket and inherit that state
+# copy-on-write.
+#
+#   python serve.py      (run from backend/, see Dockerfile)
+#
+# Memory budget per pod (bge-base, torch, 1168-row store):
+#   shared, paid once       ~0.9 GB   model weights + torch runtime
+#                           ~5 MB     embedding store (mmap, page cache)
+#   private, per worker     ~150 MB   interpreter, FastAPI, caches
+#                           ~100 MB   activations while encoding a batch
+#   => pod memory ~= 0.9 GB + SERVE_WORKERS * 0.25 GB
+# ONNX backends build their session per worker (native thread pools
+# don't survive fork): add ~0.45 GB (onnx) / ~0.12 GB (int8) per
+# worker. Check with `grep Pss /proc/<pid>/smaps_rollup`.
+#
+# Each worker gets cpu_count / SERVE_WORKERS embedding threads unless
+# EMBED_THREADS is set. /metrics reports the worker that answered.
+# ===============================================================
+
+import gc
+import os
+import signal
+import socket
+import time
+import traceback
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+
+# Must be set before rag is imported (read at import time)
+os.environ.setdefault("EMBED_THREADS", str(max(1, (os.cpu_count() or 1) // SERVE_WORKERS)))
+
+import uvicorn  # noqa: E402
+
+import rag  # noqa: E402
+from main import app  # noqa: E402
+
+
+def bind_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock):
+    config = uvicorn.Config(app, host=HOST, port=PORT, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(sock)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    t0 = time.perf_counter()
+    rag.preload()
+    print(f"✅ Preloaded in parent ({(time.perf_counter() - t0) * 1000:.0f} ms): {rag.startup_timings}")
+
+    sock = bind_socket()
+    if SERVE_WORKERS <= 1:
+        run_worker(sock)
+        return
+
+    # Keep the GC from touching (and un-sharing) every inherited object
+    gc.collect()
+    gc.freeze()
+
+    workers = {spawn(sock) for _ in range(SERVE_WORKERS)}
+    print(f"🔹 {SERVE_WORKERS} workers on {HOST}:{PORT}: {sorted(workers)}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited ({os.waitstatus_to_exitcode(status)}), respawning")
+            workers.add(spawn(sock))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from filters import FILTER_KEYS, build_partitions, normalize_value
+
+# --------------------------------------------------------
+# Collection order (rows of the fused matrix are grouped
+# by collection in this order)
+# --------------------------------------------------------
+COLLECTION_ORDER = ["scene", "explanation", "context", "speaker"]
+
+
+# --------------------------------------------------------
+# Embedding store layout (one directory, every column its own
+# file so it can be memory-mapped):
+#   embeddings.npy     float32 / float16 (rows, dim)
+#   coll_ids.npy       int32 collection per row
+#   ids.npy            chunk id per row
+#   meta_<key>.npy     one column per metadata key ("" = unset)
+#   text.bin           all chunk texts, utf-8, back to back
+#   text_offsets.npy   int64 (rows + 1) byte offsets into text.bin
+#   store.json         names, meta keys, dtype, fingerprint
+# --------------------------------------------------------
+STORE_FORMAT = 1
+STORE_DTYPES = ("float32", "float16")
+
+
+def chunk_key(collection, chunk_id):
+    return f"{collection}:{chunk_id}"
+
+
+def _str_column(values):
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+# --------------------------------------------------------
+# FUSED INDEX: every collection in one matrix, rows grouped
+# by collection; text and metadata are columnar and decoded
+# per result row
+# --------------------------------------------------------
+class FusedIndex:
+    def __init__(self, names, matrix, coll_ids, ids, text, text_offsets, meta_columns, version=None):
+        self.names = list(names)
+        # float16 stores stay float16 (and mmap-backed); searches upcast per matmul
+        dtype = np.float16 if matrix.dtype == np.float16 else np.float32
+        self.matrix = np.ascontiguousarray(matrix, dtype=dtype)
+        self.coll_ids = np.asarray(coll_ids, dtype=np.int32)
+        self.ids = np.asarray(ids, dtype=str)
+        self.text = text
+        self.text_offsets = np.asarray(text_offsets, dtype=np.int64)
+        self.meta_columns = meta_columns
+        self._fingerprint = version
+
+        # Rows are contiguous per collection -> [start, end) per collection id
+        counts = np.bincount(self.coll_ids, minlength=len(self.names))
+        ends = np.cumsum(counts)
+        self.segments = [(int(e - c), int(e)) for c, e in zip(counts, ends)]
+
+        # act / scene / speaker / type -> sorted rows
+        self.partitions = build_partitions(self.meta_columns)
+        self._rows_by_key = None
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @classmethod
+    def from_rows(cls, names, matrix, coll_ids, ids, docs, metas, version=None):
+        encoded = [d.encode("utf-8") for d in docs]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        text = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        keys = sorted({k for m in metas for k in (m or {})})
+        columns = {k: _str_column([(m or {}).get(k) for m in metas]) for k in keys}
+        return cls(names, matrix, coll_ids, ids, text, offsets, columns, version=version)
+
+    # ----------------------------------------------------
+    # Build once from the persisted Chroma collections
+    # ----------------------------------------------------
+    @classmethod
+    def from_chroma(cls, collections, order=COLLECTION_ORDER, version=None):
+        blocks, coll_ids, ids, docs, metas = [], [], [], [], []
+
+        for cid, name in enumerate(order):
+            res = collections[name].get(include=["embeddings", "documents", "metadatas"])
+            if not res["ids"]:
+                continue
+
+            blocks.append(np.asarray(res["embeddings"], dtype=np.float32))
+            coll_ids.extend([cid] * len(res["ids"]))
+            ids.extend(res["ids"])
+            docs.extend(res["documents"])
+            metas.extend(res["metadatas"])
+
+        matrix = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        return cls.from_rows(order, matrix, coll_ids, ids, docs, metas, version=version)
+
+    # ----------------------------------------------------
+    # Row accessors
+    # ----------------------------------------------------
+    def doc(self, row):
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return bytes(self.text[start:end]).decode("utf-8")
+
+    def meta(self, row):
+        out = {}
+        for key, col in self.meta_columns.items():
+            v = str(col[row])
+            if v:
+                out[key] = v
+        return out
+
+    # ----------------------------------------------------
+    # Store: written by the indexer (or prebake.py), loaded
+    # with every array memory-mapped, so workers on one node
+    # share the pages through the OS cache
+    # ----------------------------------------------------
+    def save(self, path, dtype="float32"):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"dtype must be one of {STORE_DTYPES}, got {dtype!r}")
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "embeddings.npy"), self.matrix.astype(dtype))
+        np.save(os.path.join(path, "coll_ids.npy"), self.coll_ids)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "text_offsets.npy"), self.text_offsets)
+        for key, col in self.meta_columns.items():
+            np.save(os.path.join(path, f"meta_{key}.npy"), col)
+        with open(os.path.join(path, "text.bin"), "wb") as f:
+            f.write(np.asarray(self.text, dtype=np.uint8).tobytes())
+
+        # Written last: a store without store.json is treated as absent
+        tmp = os.path.join(path, "store.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "format": STORE_FORMAT,
+                "fingerprint": self.fingerprint(),
+                "names": self.names,
+                "meta_keys": list(self.meta_columns),
+                "dtype": dtype,
+                "rows": len(self),
+            }, f, indent=1)
+        os.replace(tmp, os.path.join(path, "store.json"))
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "store.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+
+        def mmap(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        text_path = os.path.join(path, "text.bin")
+        text = np.memmap(text_path, dtype=np.uint8, mode="r") if os.path.getsize(text_path) \
+            else np.zeros(0, dtype=np.uint8)
+
+        return cls(
+            info["names"], mmap("embeddings.npy"), mmap("coll_ids.npy"), mmap("ids.npy"),
+            text, mmap("text_offsets.npy"),
+            {key: mmap(f"meta_{key}.npy") for key in info["meta_keys"]},
+            version=info.get("fingerprint"),
+        )
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "store.json"))
+
+    # ----------------------------------------------------
+    # Content fingerprint (changes whenever the store is rebuilt).
+    # Uses the indexer's manifest version when one was given.
+    # ----------------------------------------------------
+    def fingerprint(self):
+        if self._fingerprint:
+            return self._fingerprint
+
+        h = hashlib.sha1()
+        h.update(json.dumps(self.names).encode("utf-8"))
+        h.update(json.dumps(self.ids.tolist()).encode("utf-8"))
+        h.update(np.asarray(self.text).tobytes())
+        h.update(np.ascontiguousarray(self.matrix, dtype=np.float32).tobytes())
+        self._fingerprint = h.hexdigest()[:16]
+        return self._fingerprint
+
+    def row_weights(self, weights):
+        w = np.array([weights.get(n, 1.0) for n in self.names], dtype=np.float32)
+        return w[self.coll_ids]
+
+    def row_keys(self):
+        return [chunk_key(self.names[c], i) for c, i in zip(self.coll_ids.tolist(), self.ids.tolist())]
+
+    def row_for_key(self, key):
+        # Chunk table lookup: "collection:id" -> row (None if unknown)
+        if self._rows_by_key is None:
+            self._rows_by_key = {k: row for row, k in enumerate(self.row_keys())}
+        return self._rows_by_key.get(key)
+
+    # ----------------------------------------------------
+    # FILTERS: intersect the precomputed partitions
+    # ----------------------------------------------------
+    def partition_values(self, key):
+        return list(self.partitions.get(key, {}))
+
+    def has_partition(self, key):
+        # False when the store predates that metadata (e.g. speakers)
+        return bool(self.partitions.get(key))
+
+    def filter_rows(self, filters):
+        rows = None
+        for key in FILTER_KEYS:
+            if filters.get(key) in (None, ""):
+                continue
+            part = self.partitions.get(key, {}).get(normalize_value(key, filters[key]))
+            if part is None:
+                return np.zeros(0, dtype=np.int64)
+            rows = part if rows is None else np.intersect1d(rows, part, assume_unique=True)
+        return np.arange(len(self), dtype=np.int64) if rows is None else rows
+
+    # ----------------------------------------------------
+    # SEARCH: one matmul, weights applied in the same pass,
+    # top-k per collection via argpartition. `fuse`, if given,
+    # maps the (queries, rows) dense base scores to fused ones.
+    # `rows` (sorted, from filter_rows) restricts the scan to
+    # that slice of the matrix. With a `hierarchy` only the
+    # speaker vectors are scanned and every other row scores
+    # as an aggregate of the speaker chunks it covers.
+    # ----------------------------------------------------
+    def search_batch(self, q_vecs, k, weights, fuse=None, rows=None, hierarchy=None):
+        q = np.asarray(q_vecs, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+
+        if rows is None:
+            segments, row_w = self.segments, self.row_weights(weights)
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            # Collections stay contiguous inside a sorted row slice
+            cuts = np.searchsorted(rows, [start for start, _ in self.segments] + [len(self)])
+            segments = list(zip(cuts[:-1].tolist(), cuts[1:].tolist()))
+            row_w = self.row_weights(weights)[rows]
+
+        if hierarchy is not None:
+            base = hierarchy.base_scores(q, self.matrix)
+            if rows is not None:
+                base = base[:, rows]
+        else:
+            sims = q @ (self.matrix if rows is None else self.matrix[rows]).T
+            # Squared L2 on unit vectors (Chroma's default "l2" space): 2 - 2*cos
+            dist = np.maximum(2.0 - 2.0 * sims, 0.0)
+            base = 1.0 / (1.0 + dist)
+        if fuse is not None:
+            base = fuse(base)
+        conf = row_w * base
+
+        picked = []
+        for start, end in segments:
+            n = end - start
+            if n == 0:
+                continue
+            kk = min(k, n)
+            seg = conf[:, start:end]
+            best = np.argpartition(-seg, kk - 1, axis=1)[:, :kk] if kk < n else \
+                np.broadcast_to(np.arange(n), (q.shape[0], n))
+            picked.append(best + start)
+
+        if not picked:
+            return [[] for _ in range(q.shape[0])]
+
+        top = np.concatenate(picked, axis=1)
+        top_conf = np.take_along_axis(conf, top, axis=1)
+        order = np.argsort(-top_conf, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_conf = np.take_along_axis(top_conf, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+
+        return [
+            [self.result(r, c) for r, c in zip(top[i], top_conf[i])]
+            for i in range(q.shape[0])
+        ]
+
+    def search(self, q_vec, k, weights, fuse=None, rows=None, hierarchy=None):
+        return self.search_batch(q_vec, k, weights, fuse=fuse, rows=rows, hierarchy=hierarchy)[0]
+
+    def result(self, row, conf):
+        return {
+            "id": str(self.ids[row]),
+            "row": int(row),
+            "collection": self.names[self.coll_ids[row]],
+            "chunk": self.doc(row),
+            "metadata": self.meta(row),
+            "confidence": float(conf),
+        }
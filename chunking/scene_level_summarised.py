@@ -1,18 +1,26 @@
+import asyncio
+import hashlib
 import json
+import os
+import random
+import time
 from collections import defaultdict
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
 API_KEY = os.getenv("GEMINI_API_KEY")
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=API_KEY,
-    temperature=0
-)
+# gemini | stub (offline, deterministic; for testing the pipeline).
+# EXPLAIN_-prefixed so the backend's LLM_* settings in the shared
+# .env don't leak in
+EXPLAIN_PROVIDER = os.getenv("EXPLAIN_PROVIDER", "gemini")
+EXPLAIN_MODEL = os.getenv("EXPLAIN_MODEL", "gemini-2.0-flash")
+
+EXPLAIN_CONCURRENCY = int(os.getenv("EXPLAIN_CONCURRENCY", "4"))   # requests in flight
+EXPLAIN_RETRIES = int(os.getenv("EXPLAIN_RETRIES", "5"))
+EXPLAIN_BACKOFF = float(os.getenv("EXPLAIN_BACKOFF", "1.0"))       # seconds, doubled per retry
+EXPLAIN_TIMEOUT = float(os.getenv("EXPLAIN_TIMEOUT", "60"))
 
 
 INPUT_PATH = "julius_caesar_chunks.jsonl"
@@ -20,6 +28,36 @@ INPUT_PATH = "julius_caesar_chunks.jsonl"
 
 OUTPUT_PATH = "julius_caesar_explanation_chunks.jsonl"
 
+# Content-addressed cache + checkpoint: one JSON line per generated
+# explanation, appended as soon as it returns
+CACHE_PATH = os.getenv("EXPLANATION_CACHE", ".explanation_cache.jsonl")
+
+# Stub runs never touch the real explanations or their cache
+if EXPLAIN_PROVIDER == "stub":
+    OUTPUT_PATH = "julius_caesar_explanation_chunks.stub.jsonl"
+    CACHE_PATH = os.getenv("EXPLANATION_CACHE", ".explanation_cache.stub.jsonl")
+
+
+PROMPT_TEMPLATE = """
+Write an analytical explanation of Act {act}, Scene {scene} from *Julius Caesar*.
+
+Rules:
+- DO NOT retell the whole scene.
+- Focus ONLY on meaning: character motivation, emotional conflict, themes, political tension, and cause–effect.
+- Write 3–5 sentences MAX.
+- No external knowledge; use ONLY the text below.
+- Tone should be scholarly and analytical.
+
+Scene text:
+\"\"\"
+{full_text}
+\"\"\"
+"""
+
+
+def sha1(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 
 # ------------------------------------------
 # Load all speaker-level chunks
@@ -49,50 +87,151 @@ def group_by_scene(chunks):
 
 
 # ------------------------------------------
-# Ask LLM to produce explanation
+# LLM providers (async)
 # ------------------------------------------
-def generate_explanation(act, scene, full_text):
-    prompt = f"""
-Write an analytical explanation of Act {act}, Scene {scene} from *Julius Caesar*.
+class GeminiLLM:
+    def __init__(self, model):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        self.model = model
+        self.llm = ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=API_KEY,
+            temperature=0
+        )
+
+    async def generate(self, prompt):
+        out = await self.llm.ainvoke(prompt)
+        return out.content.strip()
+
+
+class StubLLM:
+    # Offline stand-in: deterministic text, optional latency and
+    # failure rate to exercise concurrency and retries
+    def __init__(self, model):
+        self.model = model
+        self.latency = float(os.getenv("STUB_LATENCY_MS", "50")) / 1000
+        self.fail_rate = float(os.getenv("STUB_FAIL_RATE", "0"))
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            raise RuntimeError("stub: simulated transient failure")
+        return f"[stub {self.model}] Explanation for prompt {sha1(prompt)[:12]}."
+
+
+def get_llm():
+    if EXPLAIN_PROVIDER == "stub":
+        return StubLLM(EXPLAIN_MODEL)
+    if EXPLAIN_PROVIDER == "gemini":
+        return GeminiLLM(EXPLAIN_MODEL)
+    raise ValueError(f"Unknown EXPLAIN_PROVIDER: {EXPLAIN_PROVIDER!r} (expected gemini | stub)")
 
-Rules:
-- DO NOT retell the whole scene.
-- Focus ONLY on meaning: character motivation, emotional conflict, themes, political tension, and cause–effect.
-- Write 3–5 sentences MAX.
-- No external knowledge; use ONLY the text below.
-- Tone should be scholarly and analytical.
 
-Scene text:
-\"\"\"
-{full_text}
-\"\"\"
-"""
+# ------------------------------------------
+# Explanation cache, keyed on
+# (provider, model, prompt template, scene text hash)
+# ------------------------------------------
+class ExplanationCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self.entries[rec["key"]] = rec["text"]
+        self._file = None
+
+    @staticmethod
+    def key(provider, model, scene_text):
+        return sha1(f"{provider}\n{model}\n{sha1(PROMPT_TEMPLATE)}\n{sha1(scene_text)}")
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, act, scene, text):
+        self.entries[key] = text
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({
+            "key": key, "provider": EXPLAIN_PROVIDER, "model": EXPLAIN_MODEL, "act": act, "scene": scene, "text": text
+        }, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
-    out = llm.invoke(prompt)
-    return out.content.strip()
+
+# ------------------------------------------
+# Ask LLM to produce explanation (bounded, with retry/backoff)
+# ------------------------------------------
+async def generate_explanation(llm, sem, act, scene, full_text):
+    prompt = PROMPT_TEMPLATE.format(act=act, scene=scene, full_text=full_text)
+
+    for attempt in range(EXPLAIN_RETRIES + 1):
+        try:
+            async with sem:
+                return await asyncio.wait_for(llm.generate(prompt), EXPLAIN_TIMEOUT)
+        except Exception as e:
+            if attempt == EXPLAIN_RETRIES:
+                raise
+            delay = EXPLAIN_BACKOFF * 2 ** attempt * (0.5 + random.random())
+            print(f"⚠️ Act {act}, Scene {scene}: {e!r}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
 
 # ------------------------------------------
 # Build explanation-level chunks
 # ------------------------------------------
-def build_explanation_chunks(scene_dict):
-    explanation_chunks = []
+async def build_explanation_chunks(scene_dict, cache, llm=None):
+    sem = asyncio.Semaphore(EXPLAIN_CONCURRENCY)
+    texts = {}
+    pending = []
 
     for (act, scene), lines in scene_dict.items():
         combined_scene_text = " ".join(lines)
-        explanation = generate_explanation(act, scene, combined_scene_text)
+        key = ExplanationCache.key(EXPLAIN_PROVIDER, EXPLAIN_MODEL, combined_scene_text)
+        cached = cache.get(key)
+        if cached is not None:
+            texts[(act, scene)] = cached
+        else:
+            pending.append((act, scene, key, combined_scene_text))
+
+    print(f"{len(texts)} scenes cached, {len(pending)} to generate")
+
+    if pending:
+        llm = llm or get_llm()
+
+        async def run(act, scene, key, full_text):
+            text = await generate_explanation(llm, sem, act, scene, full_text)
+            cache.put(key, act, scene, text)        # checkpoint immediately
+            texts[(act, scene)] = text
+            print(f"✓ Generated explanation for Act {act}, Scene {scene}")
+
+        results = await asyncio.gather(*(run(*p) for p in pending), return_exceptions=True)
+        failed = [(p[0], p[1], r) for p, r in zip(pending, results) if isinstance(r, Exception)]
+        if failed:
+            for act, scene, err in failed:
+                print(f"❌ Act {act}, Scene {scene}: {err!r}")
+            raise RuntimeError(f"{len(failed)} scenes failed; rerun to resume from the cache")
 
+    explanation_chunks = []
+    for act, scene in scene_dict:
         explanation_chunks.append({
             "id": f"{act}_{scene}",
             "act": act,
             "scene": scene,
             "speaker": None,                   # always None for explanation
             "type": "explanation",
-            "text": explanation
+            "text": texts[(act, scene)]
         })
 
-        print(f"✓ Generated explanation for Act {act}, Scene {scene}")
-
     return explanation_chunks
 
 
@@ -100,28 +239,35 @@ def build_explanation_chunks(scene_dict):
 # Save outputs
 # ------------------------------------------
 def save_jsonl(chunks, path):
-    with open(path, "w", encoding="utf-8") as f:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         for ch in chunks:
             f.write(json.dumps(ch, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
 
 
 # ------------------------------------------
 # MAIN
 # ------------------------------------------
 def main():
+    t0 = time.perf_counter()
     print("Loading speaker-level chunks...")
     speaker_chunks = load_speaker_chunks(INPUT_PATH)
 
     print("Grouping into scenes...")
     scene_dict = group_by_scene(speaker_chunks)
 
-    print("Generating explanation-level chunks...")
-    explanation_chunks = build_explanation_chunks(scene_dict)
+    print(f"Generating explanation-level chunks ({EXPLAIN_PROVIDER}/{EXPLAIN_MODEL}, {EXPLAIN_CONCURRENCY} concurrent)...")
+    cache = ExplanationCache(CACHE_PATH)
+    try:
+        explanation_chunks = asyncio.run(build_explanation_chunks(scene_dict, cache))
+    finally:
+        cache.close()
 
     print("Saving...")
     save_jsonl(explanation_chunks, OUTPUT_PATH)
 
-    print(f"\n Explanation chunks saved to {OUTPUT_PATH}")
+    print(f"\n Explanation chunks saved to {OUTPUT_PATH} ({time.perf_counter() - t0:.1f}s)")
 
 
 if __name__ == "__main__":
@@ -2,15 +2,28 @@
 # Julius Caesar Chunking Script (VS Code version)
 # ===============================================================
 
-import re
+import hashlib
 import json
-import pdfplumber
+import os
+import re
+import sqlite3
+import time
+import zlib
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
 
 # ---------- Local Paths (CHANGE THESE IF NEEDED) ----------
 PDF_PATH = "./julius-caesar.pdf"
 OUT_PATH = "./julius_caesar_chunks.jsonl"
 
+# ---------- Page extraction ----------
+FIRST_PAGE = 8                                             # skip front matter
+EXTRACT_SETTINGS = {"x_tolerance": 3, "y_tolerance": 3}    # pdfplumber extract_text
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "./.page_cache.sqlite")
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
 # ---------- Regex patterns ----------
 FTLN_INLINE = re.compile(r"\bFTLN\s*\d+\b")
 INLINE_NUM = re.compile(r"\b\d{1,3}\b")
@@ -19,6 +32,11 @@ HEADER_RE  = re.compile(r"^\s*\d*\s*Julius Caesar\b.*", re.IGNORECASE)
 
 ACT_RE   = re.compile(r"^\s*ACT\s+([IVXLC\d]+)\s*$", re.IGNORECASE)
 SCENE_RE = re.compile(r"^\s*SCENE\s+([IVXLC\d]+)\s*$", re.IGNORECASE)
+ACT_LINE_RE   = re.compile(r"^\s*ACT\s+[IVXLC\d]+", re.IGNORECASE)
+SCENE_LINE_RE = re.compile(r"^\s*SCENE\s+[IVXLC\d]+", re.IGNORECASE)
+ACT_PREFIX_RE   = re.compile(r"^\s*ACT\s+", re.IGNORECASE)
+SCENE_PREFIX_RE = re.compile(r"^\s*SCENE\s+", re.IGNORECASE)
+MULTI_SPEAKER_RE = re.compile(r"(?=\b[A-Z][A-Z\s]{2,}\b)")
 
 STAGE_DIR_CUES = [
     "Enter", "Exit", "Exeunt", "Flourish", "Thunder",
@@ -68,137 +86,232 @@ def strip_trailing_header_artifacts(text: str) -> str:
     text = re.sub(r"\bACT\s*\.\s*SC\.\s*$", "", text).strip()
     return text
 
-# ---------- Main processing ----------
-def process_pdf(pdf_path):
-    chunks = []
+# ---------- Page extraction (parallel, cached) ----------
+# extract_text is by far the slowest step, so pages are fanned
+# out over a process pool and cached per page in one sqlite file
+# (zlib-compressed text), keyed on (PDF hash, page index,
+# extractor settings). Tweaking the chunking rules below then
+# re-runs from the cache without parsing the PDF.
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class PageCache:
+    def __init__(self, path, pdf_hash, settings):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "pdf TEXT, settings TEXT, page INTEGER, text BLOB, PRIMARY KEY (pdf, settings, page))"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS docs (pdf TEXT PRIMARY KEY, pages INTEGER)")
+        self.pdf = pdf_hash
+        self.settings = json.dumps(settings, sort_keys=True)
+
+    def page_count(self):
+        row = self.db.execute("SELECT pages FROM docs WHERE pdf = ?", (self.pdf,)).fetchone()
+        return row[0] if row else None
+
+    def set_page_count(self, n):
+        self.db.execute("INSERT OR REPLACE INTO docs VALUES (?, ?)", (self.pdf, n))
+
+    def load(self):
+        rows = self.db.execute(
+            "SELECT page, text FROM pages WHERE pdf = ? AND settings = ?", (self.pdf, self.settings)
+        )
+        return {page: zlib.decompress(blob).decode("utf-8") for page, blob in rows}
+
+    def put(self, page, text):
+        self.db.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+            (self.pdf, self.settings, page, zlib.compress(text.encode("utf-8"))),
+        )
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+_worker_pdf = None
+
+def init_worker(pdf_path):
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(pdf_path)
+
+def extract_page(i):
+    return _worker_pdf.pages[i].extract_text(**EXTRACT_SETTINGS) or ""
+
+def iter_pages(pdf_path):
+    """Yield each page's raw lines in order, extracting only uncached pages."""
+    settings = {**EXTRACT_SETTINGS, "pdfplumber": pdfplumber.__version__}
+    cache = PageCache(PAGE_CACHE_PATH, file_hash(pdf_path), settings)
+    try:
+        n_pages = cache.page_count()
+        if n_pages is None:
+            with pdfplumber.open(pdf_path) as pdf:
+                n_pages = len(pdf.pages)
+            cache.set_page_count(n_pages)
+
+        pages = range(FIRST_PAGE, n_pages)
+        cached = cache.load()
+        missing = [i for i in pages if i not in cached]
+        print(f"📄 {len(pages) - len(missing)} pages cached, {len(missing)} to extract ({PAGE_WORKERS} workers)")
+
+        if not missing:
+            for i in pages:
+                yield cached[i].splitlines()
+            return
+
+        with ProcessPoolExecutor(max_workers=PAGE_WORKERS, initializer=init_worker,
+                                 initargs=(pdf_path,)) as pool:
+            extracted = zip(missing, pool.map(extract_page, missing, chunksize=4))
+            for i in pages:
+                if i not in cached:
+                    _, text = next(extracted)
+                    cache.put(i, text)
+                    cached[i] = text
+                yield cached[i].splitlines()
+    finally:
+        cache.close()
+
+# ---------- Chunking (single-pass state machine) ----------
+# Lines stream through once. In the "stage" state a stage
+# direction keeps absorbing lines until a speaker, ACT or SCENE
+# line (or the end of the page); everything else accumulates
+# into the current speech. Chunks are yielded as they close.
+def is_act_line(raw):
+    return ACT_LINE_RE.match(raw) is not None
+
+def is_scene_line(raw):
+    return SCENE_LINE_RE.match(raw) is not None
+
+def make_chunk(chunk_id, act, scene, speaker, chunk_type, text):
+    return {
+        "id": chunk_id,
+        "act": act,
+        "scene": scene,
+        "speaker": speaker,
+        "type": chunk_type,
+        "text": text,
+        "textLength": len(text),
+        "wordCount": count_words(text)
+    }
+
+def iter_chunks(pages):
     act = None
     scene = None
     current_speaker = None
     current_text = ""
+    stage = None          # lines of an open stage direction
     chunk_id = 0
 
-    def save_chunk(force_speaker=None):
-        nonlocal chunk_id, current_text, current_speaker
-        txt = (current_text or "").strip()
-        if not txt:
-            current_text = ""
-            return
-
-        txt = strip_trailing_header_artifacts(txt)
+    def close_speech():
+        nonlocal chunk_id, current_text
+        txt = strip_trailing_header_artifacts((current_text or "").strip())
+        current_text = ""
         if not txt:
-            current_text = ""
-            return
-
-        chunks.append({
-            "id": chunk_id,
-            "act": act,
-            "scene": scene,
-            "speaker": force_speaker if force_speaker else current_speaker,
-            "type": "speech" if (force_speaker or current_speaker) else "narration",
-            "text": txt,
-            "textLength": len(txt),
-            "wordCount": count_words(txt)
-        })
+            return None
+        chunk = make_chunk(chunk_id, act, scene, current_speaker,
+                           "speech" if current_speaker else "narration", txt)
         chunk_id += 1
-        current_text = ""
-
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages[8:]:
-            raw_lines = (page.extract_text() or "").splitlines()
-            idx = 0
-            n = len(raw_lines)
+        return chunk
 
-            while idx < n:
-                raw = raw_lines[idx].rstrip()
-                idx += 1
+    def close_stage():
+        nonlocal chunk_id, stage
+        txt = strip_trailing_header_artifacts(" ".join(stage).strip())
+        stage = None
+        chunk = make_chunk(chunk_id, act, scene, None, "stage_direction", txt)
+        chunk_id += 1
+        return chunk
 
-                if not raw:
-                    continue
+    for raw_lines in pages:
+        for raw in raw_lines:
+            if stage is not None:
                 if STANDALONE_NUM.match(raw) or HEADER_RE.match(raw):
                     continue
-
-                if re.match(r"^\s*ACT\s+[IVXLC\d]+", raw, re.IGNORECASE):
-                    save_chunk()
-                    act = re.sub(r"^\s*ACT\s+", "", raw, flags=re.IGNORECASE).strip()
-                    scene = None
-                    continue
-
-                if re.match(r"^\s*SCENE\s+[IVXLC\d]+", raw, re.IGNORECASE):
-                    save_chunk()
-                    scene = re.sub(r"^\s*SCENE\s+", "", raw, flags=re.IGNORECASE).strip()
-                    continue
-
-                line = clean_line(raw)
-                if not line:
+                look_clean = clean_line(raw)
+                if not (is_speaker_line_candidate(look_clean) or is_act_line(raw) or is_scene_line(raw)):
+                    stage.append(look_clean)
                     continue
-
-                if is_stage_direction_start(line):
-                    save_chunk()
-                    segs = [line]
-
-                    while idx < n:
-                        look = raw_lines[idx]
-                        look_clean = clean_line(look)
-
-                        if STANDALONE_NUM.match(look) or HEADER_RE.match(look):
-                            idx += 1
-                            continue
-
-                        if (
-                            is_speaker_line_candidate(look_clean)
-                            or re.match(r"^\s*ACT\s+[IVXLC\d]+", look, re.IGNORECASE)
-                            or re.match(r"^\s*SCENE\s+[IVXLC\d]+", look, re.IGNORECASE)
-                        ):
-                            break
-
-                        segs.append(look_clean)
-                        idx += 1
-
-                    full_stage = strip_trailing_header_artifacts(" ".join(segs).strip())
-
-                    chunks.append({
-                        "id": chunk_id,
-                        "act": act,
-                        "scene": scene,
-                        "speaker": None,
-                        "type": "stage_direction",
-                        "text": full_stage,
-                        "textLength": len(full_stage),
-                        "wordCount": count_words(full_stage)
-                    })
-                    chunk_id += 1
+                yield close_stage()
+
+            raw = raw.rstrip()
+            if not raw:
+                continue
+            if STANDALONE_NUM.match(raw) or HEADER_RE.match(raw):
+                continue
+
+            if is_act_line(raw):
+                chunk = close_speech()
+                if chunk:
+                    yield chunk
+                act = ACT_PREFIX_RE.sub("", raw).strip()
+                scene = None
+                continue
+
+            if is_scene_line(raw):
+                chunk = close_speech()
+                if chunk:
+                    yield chunk
+                scene = SCENE_PREFIX_RE.sub("", raw).strip()
+                continue
+
+            line = clean_line(raw)
+            if not line:
+                continue
+
+            if is_stage_direction_start(line):
+                chunk = close_speech()
+                if chunk:
+                    yield chunk
+                stage = [line]
+                continue
+
+            for seg in MULTI_SPEAKER_RE.split(line):
+                seg = seg.strip()
+                if not seg:
                     continue
 
-                multi_segments = re.split(r"(?=\b[A-Z][A-Z\s]{2,}\b)", line)
-
-                for seg in multi_segments:
-                    seg = seg.strip()
-                    if not seg:
-                        continue
+                first_tok = seg.split(" ")[0]
+                if is_speaker_line_candidate(first_tok):
+                    chunk = close_speech()
+                    if chunk:
+                        yield chunk
+                    current_speaker = first_tok
+                    current_text = " ".join(seg.split(" ")[1:]).strip()
+                else:
+                    current_text += (" " + seg if current_text else seg)
 
-                    first_tok = seg.split(" ")[0]
-                    speaker_candidate = is_speaker_line_candidate(first_tok)
+        # a stage direction never continues across a page break
+        if stage is not None:
+            yield close_stage()
 
-                    if speaker_candidate:
-                        save_chunk()
-                        current_speaker = first_tok
-                        remaining = " ".join(seg.split(" ")[1:]).strip()
-                        current_text = remaining
-                    else:
-                        current_text += (" " + seg if current_text else seg)
+    chunk = close_speech()
+    if chunk:
+        yield chunk
 
-    save_chunk()
-    return chunks
+def process_pdf(pdf_path):
+    return iter_chunks(iter_pages(pdf_path))
 
 # ---------- Run ----------
-print("📘 Extracting and chunking Julius Caesar PDF...")
-chunks = process_pdf(PDF_PATH)
-
-with open(OUT_PATH, "w", encoding="utf-8") as f:
-    for ch in chunks:
-        f.write(json.dumps(ch, ensure_ascii=False) + "\n")
-
-type_counts = Counter([c["type"] for c in chunks])
-print("\n✅ Chunking complete!")
-print(f"Total chunks: {len(chunks)}")
-print(f"Chunks by type: {dict(type_counts)}")
+def main():
+    t0 = time.perf_counter()
+    print("📘 Extracting and chunking Julius Caesar PDF...")
+
+    type_counts = Counter()
+    tmp = OUT_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for ch in process_pdf(PDF_PATH):
+            f.write(json.dumps(ch, ensure_ascii=False) + "\n")
+            type_counts[ch["type"]] += 1
+    os.replace(tmp, OUT_PATH)
+
+    print("\n✅ Chunking complete!")
+    print(f"Total chunks: {sum(type_counts.values())}")
+    print(f"Chunks by type: {dict(type_counts)}")
+    print(f"⏱ {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
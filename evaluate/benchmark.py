@@ -0,0 +1,320 @@
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(EVAL_DIR, "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+# ----------------------------------------------------
+# Retrieval benchmark: replays testbed.json plus an
+# amplified (paraphrase-ish) query set and reports
+#   - latency p50/p95/p99 and QPS per concurrency level
+#   - memory (RSS)
+#   - recall@k / MRR against the gold act/scene labels
+# One run = one configuration, appended as a JSON line to
+# BENCH_OUTPUT so runs can be compared.
+#
+#   BENCH_MODE=inproc  rag.retrieve_top_k in this process
+#                      (configure rag via its env vars:
+#                       EMBED_BACKEND, HYBRID_MODE, RERANK,
+#                       RETRIEVAL_MODE,
+#                       EMBED_CACHE_SIZE, SEMANTIC_CACHE_SIZE, ...)
+#   BENCH_MODE=http    POST /query on BACKEND_URL; the server's
+#                      caches are cleared (POST /cache/clear,
+#                      server and client share ADMIN_TOKEN)
+#                      before every level, so point it at a
+#                      single worker (SERVE_WORKERS=1)
+#   BENCH_SEARCH=chroma  (inproc) the original per-collection
+#                      Chroma query loop, as a baseline
+#   BENCH_BASELINE=<file>  compare with a saved run, exit 1
+#                      on a regression
+# ----------------------------------------------------
+TESTBED = os.path.join(EVAL_DIR, "testbed.json")
+BENCH_OUTPUT = os.getenv("BENCH_OUTPUT", os.path.join(EVAL_DIR, "benchmark_results.jsonl"))
+BENCH_MODE = os.getenv("BENCH_MODE", "inproc")                 # inproc | http
+BENCH_SEARCH = os.getenv("BENCH_SEARCH", "fused")              # fused | chroma
+BENCH_LABEL = os.getenv("BENCH_LABEL", "")
+BENCH_BASELINE = os.getenv("BENCH_BASELINE")
+CONCURRENCY = [int(c) for c in os.getenv("BENCH_CONCURRENCY", "1,4,16").split(",")]
+AMPLIFY = int(os.getenv("BENCH_AMPLIFY", "10"))                 # variants per question
+SEED = int(os.getenv("BENCH_SEED", "13"))
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000/query")
+SERVER_PID = os.getenv("BENCH_SERVER_PID")                      # http: read server RSS
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")                      # http: for /cache/clear
+TIMEOUT = 40
+K_VALUES = [1, 3, 5, 8]
+
+# Regression thresholds vs BENCH_BASELINE
+MAX_P95_INCREASE = 0.20
+MAX_RECALL_DROP = 0.02
+
+
+# ----------------------------------------------------
+# QUERY SETS
+# ----------------------------------------------------
+PREFIXES = ["", "In Julius Caesar, ", "In the play, ", "Explain: ", "Quick question: "]
+SUFFIXES = ["", "?", " in the play?", " Explain briefly.", " (Shakespeare)"]
+
+
+def amplify(question, rng):
+    words = question.rstrip("?").split()
+    if len(words) > 4 and rng.random() < 0.3:
+        del words[rng.randrange(1, len(words))]      # drop a word
+    text = " ".join(words)
+    text = text.lower() if rng.random() < 0.3 else text
+    text = text.replace(" ", "  ", 1) if rng.random() < 0.2 else text
+    return rng.choice(PREFIXES) + text + rng.choice(SUFFIXES)
+
+
+def load_queries():
+    with open(TESTBED, "r", encoding="utf-8") as f:
+        testbed = json.load(f)
+
+    rng = random.Random(SEED)
+    queries = [(t["question"], t["gold"], "testbed") for t in testbed]
+    for _ in range(AMPLIFY):
+        queries.extend((amplify(t["question"], rng), t["gold"], "amplified") for t in testbed)
+    return queries
+
+
+# ----------------------------------------------------
+# TARGETS: query -> list of {"act", "scene"} in rank order
+# ----------------------------------------------------
+def inproc_target():
+    # rag resolves its Chroma / store paths relative to backend/
+    os.chdir(BACKEND_DIR)
+    import rag
+
+    rag.warm_up()
+
+    if BENCH_SEARCH == "chroma":
+        collections = rag.load_chroma_collections()
+
+        def search(query):
+            q_vec = rag.normalize(rag.embed_query(query)).tolist()
+            results = []
+            for name in ["scene", "explanation", "context", "speaker"]:
+                res = collections[name].query(query_embeddings=[q_vec], n_results=rag.TOP_K)
+                for meta, dist in zip(res["metadatas"][0], res["distances"][0]):
+                    results.append((meta, 1 / (1 + dist) * rag.COLLECTION_WEIGHTS[name]))
+            results.sort(key=lambda x: x[1], reverse=True)
+            return [m for m, _ in results]
+    else:
+        def search(query):
+            # Same pipeline as POST /query: auto-filters included
+            return [r["metadata"] for r in rag.retrieve_top_k(query, filters=rag.resolve_filters(query))]
+
+    def reset():
+        rag.embedding_cache.clear()
+        if rag.semantic_cache is not None:
+            rag.semantic_cache.clear()
+        if rag.reranker is not None:
+            rag.reranker.clear()
+
+    config = {
+        "embed_backend": rag.EMBED_BACKEND,
+        "hybrid": f"{rag.HYBRID_MODE}:{rag.HYBRID_ALPHA}",
+        "retrieval": f"{rag.RETRIEVAL_MODE}:{rag.HIER_AGG}",
+        "diversify": f"{rag.MMR_LAMBDA}:{rag.DEDUP_OVERLAP}:{rag.MMR_K}" if rag.DIVERSIFY else "off",
+        "rerank": f"{rag.RERANK_MODEL}:{rag.RERANK_FETCH_K}" if rag.reranker is not None else "off",
+        "embed_cache_size": rag.EMBED_CACHE_SIZE,
+        "semantic_cache": f"{rag.SEMANTIC_CACHE_SIZE}:{rag.SEMANTIC_CACHE_THRESHOLD}",
+        "batch_window_ms": rag.BATCH_WINDOW_MS,
+        "top_k": rag.TOP_K,
+        "auto_filters": rag.AUTO_FILTERS,
+        "index_version": rag.index_version(),
+        "reset": "caches cleared before every level",
+    }
+    return search, reset, config
+
+
+def http_target():
+    import requests
+
+    session = requests.Session()
+    base = BACKEND_URL.rsplit("/query", 1)[0]
+
+    def search(query):
+        res = session.post(BACKEND_URL, json={"query": query}, timeout=TIMEOUT)
+        res.raise_for_status()
+        return [{"act": s.get("act"), "scene": s.get("scene")} for s in res.json()["sources"]]
+
+    # Every level starts from cold server caches; the clears that
+    # went through are recorded in the run config
+    resets = []
+
+    def reset():
+        try:
+            res = session.post(base + "/cache/clear", headers={"X-Admin-Token": ADMIN_TOKEN},
+                               timeout=TIMEOUT)
+            res.raise_for_status()
+            resets.append(res.json())
+        except Exception as e:
+            resets.append(f"failed: {e}")
+
+    config = {"url": BACKEND_URL, "reset": resets}
+    try:
+        config["server"] = session.get(base + "/cache/stats", timeout=TIMEOUT).json()
+    except Exception as e:
+        config["server"] = f"unavailable: {e}"
+    return search, reset, config
+
+
+# ----------------------------------------------------
+# MEASUREMENT
+# ----------------------------------------------------
+def run_level(search, queries, concurrency):
+    errors = []
+
+    def timed(query):
+        t0 = time.perf_counter()
+        try:
+            hits = search(query)
+        except Exception as e:
+            errors.append(repr(e))
+            hits = None
+        return (time.perf_counter() - t0) * 1000, hits
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        out = list(pool.map(timed, [q for q, _, _ in queries]))
+    wall = time.perf_counter() - t0
+
+    ms = np.array([m for m, h in out if h is not None])
+    level = {
+        "concurrency": concurrency,
+        "queries": len(queries),
+        "errors": len(errors),
+        "qps": round(len(queries) / wall, 2),
+    }
+    if errors:
+        level["first_error"] = errors[0]
+    if len(ms):
+        level.update({
+            "mean_ms": round(float(ms.mean()), 3),
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        })
+    return level, [h for _, h in out]
+
+
+def quality(queries, results):
+    report = {}
+    for subset in ("testbed", "amplified"):
+        ranks = []
+        for (_, gold, kind), hits in zip(queries, results):
+            if kind != subset or hits is None:
+                continue
+            gold_set = {(g["act"], g["scene"]) for g in gold}
+            rank = next((i + 1 for i, h in enumerate(hits)
+                         if (str(h.get("act")), str(h.get("scene"))) in gold_set), None)
+            ranks.append(rank)
+        if not ranks:
+            continue
+        report[subset] = {
+            "queries": len(ranks),
+            **{f"recall@{k}": round(float(np.mean([r is not None and r <= k for r in ranks])), 4)
+               for k in K_VALUES},
+            "mrr": round(float(np.mean([1.0 / r if r else 0.0 for r in ranks])), 4),
+        }
+    return report
+
+
+def memory():
+    out = {"client_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    if BENCH_MODE == "inproc":
+        with open("/proc/self/status") as f:
+            rss = next(line for line in f if line.startswith("VmRSS"))
+        out["rss_mb"] = round(int(rss.split()[1]) / 1024, 1)
+    elif SERVER_PID:
+        with open(f"/proc/{SERVER_PID}/status") as f:
+            rss = next(line for line in f if line.startswith("VmRSS"))
+        out["server_rss_mb"] = round(int(rss.split()[1]) / 1024, 1)
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=EVAL_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+# ----------------------------------------------------
+# REGRESSION CHECK against a saved run (last line of file)
+# ----------------------------------------------------
+def load_baseline(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.loads(f.read().strip().splitlines()[-1])
+
+
+def regressions(run, base):
+    found = []
+    base_levels = {lv["concurrency"]: lv for lv in base["levels"]}
+    for lv in run["levels"]:
+        b = base_levels.get(lv["concurrency"])
+        if b and "p95_ms" in b and "p95_ms" in lv and lv["p95_ms"] > b["p95_ms"] * (1 + MAX_P95_INCREASE):
+            found.append(f"p95 @c={lv['concurrency']}: {b['p95_ms']} -> {lv['p95_ms']} ms")
+
+    for subset, q in run["quality"].items():
+        for metric, v in q.items():
+            b = base["quality"].get(subset, {}).get(metric)
+            if metric != "queries" and b is not None and v < b - MAX_RECALL_DROP:
+                found.append(f"{subset} {metric}: {b} -> {v}")
+    return found
+
+
+def main():
+    baseline = load_baseline(BENCH_BASELINE) if BENCH_BASELINE else None
+    queries = load_queries()
+    search, reset, config = inproc_target() if BENCH_MODE == "inproc" else http_target()
+
+    print(f"🔹 {BENCH_MODE}/{BENCH_SEARCH}: {len(queries)} queries, concurrency {CONCURRENCY}")
+    levels, first_results = [], None
+    for c in CONCURRENCY:
+        reset()
+        level, results = run_level(search, queries, c)
+        levels.append(level)
+        first_results = first_results or results
+        print(f"   {level}")
+
+    run = {
+        "label": BENCH_LABEL,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "mode": BENCH_MODE,
+        "search": BENCH_SEARCH,
+        "amplify": AMPLIFY,
+        "config": config,
+        "levels": levels,
+        "quality": quality(queries, first_results),
+        "memory": memory(),
+    }
+    print(json.dumps(run["quality"], indent=2))
+    print(run["memory"])
+
+    with open(BENCH_OUTPUT, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run, ensure_ascii=False) + "\n")
+    print(f"\n📁 Appended to: {BENCH_OUTPUT}")
+
+    if baseline is not None:
+        found = regressions(run, baseline)
+        for r in found:
+            print(f"❌ Regression: {r}")
+        if found:
+            sys.exit(1)
+        print("✅ No regressions vs baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,64 @@
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from tqdm import tqdm
 
-BACKEND_URL = "http://localhost:8000/query"  
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000/query")
+BATCH_URL = BACKEND_URL.rstrip("/") + "/batch"
 INPUT_QUESTIONS = "questions.json"
 OUTPUT_DATASET = "rag_dataset.json"
 
+BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "16"))     # questions per /query/batch call
+CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))    # batch calls in flight
+TIMEOUT = 40
+
+
+def post_batch(session, questions):
+    try:
+        res = session.post(
+            BATCH_URL,
+            json={"queries": questions},
+            timeout=TIMEOUT
+        )
+        res.raise_for_status()
+        return res.json()["results"]
+
+    except Exception as e:
+        return [{"answer": f"ERROR: {e}", "sources": []} for _ in questions]
+
 
 def build_rag_dataset():
-    
+
     with open(INPUT_QUESTIONS, "r", encoding="utf-8") as f:
         questions = json.load(f)
 
-    output_rows = []
-
     print("\nGenerating dataset from backend...\n")
 
-    for item in tqdm(questions):
-        q = item["question"]
-        gt = item["ideal_answer"]
+    batches = [questions[i:i + BATCH_SIZE] for i in range(0, len(questions), BATCH_SIZE)]
+    session = requests.Session()
 
-        try:
-           
-            res = requests.post(
-                BACKEND_URL,
-                json={"query": q},
-                timeout=40
-            ).json()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        # pool.map keeps batch order, so rows line up with questions
+        responses = list(tqdm(
+            pool.map(lambda b: post_batch(session, [item["question"] for item in b]), batches),
+            total=len(batches)
+        ))
 
-            answer = res.get("answer", "")
+    output_rows = []
+    for batch, results in zip(batches, responses):
+        for item, res in zip(batch, results):
             sources = res.get("sources", [])
 
-           
-            contexts = [s.get("text", "") for s in sources]
+            output_rows.append({
+                "question": item["question"],
+                "contexts": [s.get("text", "") for s in sources],
+                "ground_truth": item["ideal_answer"],
+                "answer": res.get("answer", "")
+            })
 
-        except Exception as e:
-            answer = f"ERROR: {e}"
-            contexts = []
 
-       
-        output_rows.append({
-            "question": q,
-            "contexts": contexts,
-            "ground_truth": gt,
-            "answer": answer
-        })
-
-   
     with open(OUTPUT_DATASET, "w", encoding="utf-8") as f:
         json.dump(output_rows, f, indent=2, ensure_ascii=False)
 
@@ -55,4 +67,3 @@ def build_rag_dataset():
 
 if __name__ == "__main__":
     build_rag_dataset()
-
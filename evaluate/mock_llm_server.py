@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import random
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+# ----------------------------------------------------
+# Local stand-in for an OpenAI-compatible LLM server, for
+# exercising the backend's generation path offline:
+#
+#   python evaluate/mock_llm_server.py
+#   TEST_MODE=0 LLM_PROVIDER=openai LLM_BASE_URL=http://localhost:8088/v1 \
+#       python backend/serve.py
+#
+# Knobs to provoke the timeout / fallback paths:
+#   MOCK_FIRST_TOKEN_MS  delay before the first token
+#   MOCK_TOKEN_MS        delay between tokens
+#   MOCK_FAIL_RATE       fraction of requests answered with 503
+#   MOCK_HANG_RATE       fraction of requests that never answer
+# ----------------------------------------------------
+PORT = int(os.getenv("MOCK_PORT", "8088"))
+FIRST_TOKEN_MS = float(os.getenv("MOCK_FIRST_TOKEN_MS", "200"))
+TOKEN_MS = float(os.getenv("MOCK_TOKEN_MS", "10"))
+FAIL_RATE = float(os.getenv("MOCK_FAIL_RATE", "0"))
+HANG_RATE = float(os.getenv("MOCK_HANG_RATE", "0"))
+
+app = FastAPI(title="Mock LLM")
+stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "prompt_chars": 0}
+
+
+def answer_for(prompt):
+    context = prompt.split("Context:", 1)[-1].split("Question:", 1)[0]
+    header = next((line for line in context.splitlines() if line.startswith("[Act")), "[no context]")
+    return f"Mock answer grounded in {header.strip('[]')}, from {len(context)} context chars."
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    stats["requests"] += 1
+    stats["prompt_chars"] += len(prompt)
+
+    if not body.get("stream"):
+        raise HTTPException(status_code=400, detail="mock: only stream=true is implemented")
+    if random.random() < FAIL_RATE:
+        raise HTTPException(status_code=503, detail="mock: simulated overload")
+
+    async def events():
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            if random.random() < HANG_RATE:
+                await asyncio.sleep(3600)
+            await asyncio.sleep(FIRST_TOKEN_MS / 1000)
+            for word in answer_for(prompt).split(" "):
+                delta = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+                await asyncio.sleep(TOKEN_MS / 1000)
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["in_flight"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="warning")
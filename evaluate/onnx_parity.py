@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from embedders import load_embedder  # noqa: E402
+
+# ----------------------------------------------------
+# Parity check: ONNX / int8 embeddings vs the torch model
+#   - cosine(torch, variant) on testbed questions
+#   - recall@k of retrieval over the torch-built corpus
+#   - per-query latency
+# ----------------------------------------------------
+MODEL_NAME = "BAAI/bge-base-en-v1.5"
+ONNX_DIR = os.getenv("ONNX_DIR", "../backend/onnx_bge")
+TESTBED = "testbed.json"
+CHUNK_FILES = [
+    "../chunks/julius_caesar_scene_chunks.jsonl",
+    "../chunks/julius_caesar_explanation_chunks.jsonl",
+    "../chunks/julius_caesar_context_windows.jsonl",
+    "../chunks/julius_caesar_chunks.jsonl",
+]
+K_VALUES = [1, 5, 10]
+OUTPUT = "onnx_parity.json"
+
+
+def load_corpus():
+    texts = []
+    for path in CHUNK_FILES:
+        with open(path, "r", encoding="utf-8") as f:
+            texts.extend(json.loads(line)["text"] for line in f if line.strip())
+    return [t for t in texts if t]
+
+
+def time_per_query(embedder, questions):
+    embedder.encode(questions[:1])   # warm-up
+    t0 = time.perf_counter()
+    for q in questions:
+        embedder.encode([q])
+    return (time.perf_counter() - t0) * 1000 / len(questions)
+
+
+def recall_at_k(ref_q, var_q, corpus, k):
+    ref_top = np.argsort(-(ref_q @ corpus.T), axis=1)[:, :k]
+    var_top = np.argsort(-(var_q @ corpus.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, var_top)]))
+
+
+def main():
+    with open(TESTBED, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)]
+    corpus_texts = load_corpus()
+
+    print("🔹 torch reference...")
+    torch_emb = load_embedder("torch", MODEL_NAME)
+    ref_q = torch_emb.encode(questions)
+    corpus = torch_emb.encode(corpus_texts)
+
+    report = {
+        "questions": len(questions),
+        "corpus": len(corpus_texts),
+        "torch": {"ms_per_query": round(time_per_query(torch_emb, questions), 2)},
+    }
+
+    for variant in ["onnx", "onnx-int8"]:
+        try:
+            emb = load_embedder(variant, MODEL_NAME, onnx_dir=ONNX_DIR)
+        except FileNotFoundError as e:
+            print(f"⚠️ Skipping {variant}: {e}")
+            continue
+
+        print(f"🔹 {variant}...")
+        var_q = emb.encode(questions)
+        cos = np.sum(ref_q * var_q, axis=1)
+
+        report[variant] = {
+            "ms_per_query": round(time_per_query(emb, questions), 2),
+            "cosine_min": round(float(cos.min()), 5),
+            "cosine_mean": round(float(cos.mean()), 5),
+            **{f"recall@{k}": round(recall_at_k(ref_q, var_q, corpus, k), 4) for k in K_VALUES},
+        }
+
+    print(json.dumps(report, indent=2))
+    with open(OUTPUT, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📁 Saved to: {OUTPUT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+# ----------------------------------------------------
+# Re-ranking trade-off on testbed.json: precision of the
+# returned sources vs the latency the cross-encoder adds,
+# for several candidate counts (per-collection fetch k).
+#
+# The testbed has no chunk labels, so a source counts as
+# relevant when it contains at least RELEVANT_OVERLAP of the
+# ideal answer's content tokens.
+# ----------------------------------------------------
+TESTBED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testbed.json")
+OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rerank_compare.json")
+FETCH_KS = [int(k) for k in os.getenv("RERANK_FETCH_KS", "2,3,5,8,12").split(",")]
+RELEVANT_OVERLAP = 0.5
+REPEATS = 3
+
+
+def relevant(chunk, answer_tokens, tokenize):
+    if not answer_tokens:
+        return False
+    return len(answer_tokens & set(tokenize(chunk))) / len(answer_tokens) >= RELEVANT_OVERLAP
+
+
+def main():
+    with open(TESTBED, "r", encoding="utf-8") as f:
+        testbed = json.load(f)
+
+    # rag resolves its Chroma / store paths relative to backend/
+    os.chdir(BACKEND_DIR)
+    import rag
+    from lexical import tokenize
+    from reranker import CrossEncoderReranker
+
+    questions = [t["question"] for t in testbed]
+    answers = [set(tokenize(t["ideal_answer"])) for t in testbed]
+    top_n = rag.TOP_K * len(rag.COLLECTION_WEIGHTS)
+
+    rag.warm_up()
+    reranker = CrossEncoderReranker(rag.RERANK_MODEL, max_length=rag.RERANK_MAX_LENGTH,
+                                    threads=rag.EMBED_THREADS)
+    reranker.get_model()
+    reranker.score(questions[0], [{"chunk": "warm up"}])
+
+    report = {"questions": len(questions), "top_n": top_n, "model": rag.RERANK_MODEL, "runs": []}
+
+    for fetch_k in FETCH_KS:
+        precision, hit1, added_ms = [], [], []
+        for q, ans in zip(questions, answers):
+            candidates = rag.retrieve_candidates(q, fetch_k)
+            if fetch_k == rag.TOP_K:
+                ranked = candidates[:top_n]      # baseline: no re-ranking
+                added_ms.append(0.0)
+            else:
+                for _ in range(REPEATS):
+                    reranker.clear()             # measure uncached scoring
+                    t0 = time.perf_counter()
+                    ranked = reranker.rerank(q, candidates, top_n)
+                    added_ms.append((time.perf_counter() - t0) * 1000)
+
+            rel = [relevant(c["chunk"], ans, tokenize) for c in ranked]
+            precision.append(np.mean(rel) if rel else 0.0)
+            hit1.append(float(rel[0]) if rel else 0.0)
+
+        run = {
+            "fetch_k": fetch_k,
+            "candidates": fetch_k * len(rag.COLLECTION_WEIGHTS),
+            "reranked": fetch_k != rag.TOP_K,
+            f"precision@{top_n}": round(float(np.mean(precision)), 4),
+            "hit@1": round(float(np.mean(hit1)), 4),
+            "added_ms_mean": round(float(np.mean(added_ms)), 2),
+            "added_ms_p95": round(float(np.percentile(added_ms, 95)), 2),
+        }
+        report["runs"].append(run)
+        print(run)
+
+    with open(OUTPUT, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📁 Saved to: {OUTPUT}")
+
+
+if __name__ == "__main__":
+    main()
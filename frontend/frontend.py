@@ -1,3 +1,4 @@
+import json
 import streamlit as st
 import requests
 
@@ -9,6 +10,7 @@ st.write("Ask me brooo any question about *Julius Caesar* and get a scholarly an
 # API_URL = "http://localhost:8000/query"
 import os
 API_URL = os.getenv("BACKEND_URL", "http://localhost:8000/query")
+STREAM_URL = API_URL.rstrip("/") + "/stream"
 
 def conf_color(conf):
     if conf >= 0.75: return "🟢"
@@ -21,30 +23,47 @@ if st.button("Ask"):
     if not query.strip():
         st.warning("Please enter a question.")
     else:
-        with st.spinner("Thinking like a Shakespearean Scholar..."):
-            try:
-                response = requests.post(API_URL, json={"query": query})
-                data = response.json()
+        try:
+            st.subheader("📘 Answer")
+            answer_box = st.empty()
+            answer_box.write("_Thinking like a Shakespearean Scholar..._")
 
-                st.subheader("📘 Answer")
-                st.write(data["answer"])
+            st.subheader("📚 Supporting Sources")
+            sources_box = st.container()
 
-                st.subheader("📚 Supporting Sources")
+            answer = ""
+            with requests.post(STREAM_URL, json={"query": query}, stream=True) as response:
+                response.raise_for_status()
 
-                
-                sources = sorted(data["sources"], key=lambda x: x["confidence"], reverse=True)
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    event = json.loads(line)
 
-                for i, src in enumerate(sources, start=1):
-                    color = conf_color(src["confidence"])
-                    title = (
-                        f"{color} Source {i} | "
-                        f"Act {src['act']} Scene {src['scene']} | "
-                        f"{src['collection']} | "
-                        f"Confidence: {src['confidence']}"
-                    )
+                    # Sources arrive first, as soon as retrieval is done, already
+                    # in final order (re-ranked / diversified by the backend)
+                    if event["type"] == "sources":
+                        sources = event["sources"]
 
-                    with st.expander(title):
-                        st.write(src["text"])
+                        with sources_box:
+                            for i, src in enumerate(sources, start=1):
+                                color = conf_color(src["confidence"])
+                                title = (
+                                    f"{color} Source {i} | "
+                                    f"Act {src['act']} Scene {src['scene']} | "
+                                    f"{src['collection']} | "
+                                    f"Confidence: {src['confidence']}"
+                                )
 
-            except Exception as e:
-                st.error(f"Error: {e}")
+                                with st.expander(title):
+                                    st.write(src["text"])
+
+                    elif event["type"] == "token":
+                        answer += event["text"]
+                        answer_box.write(answer)
+
+                    elif event["type"] == "error":
+                        st.error(f"Error: {event['detail']}")
+
+        except Exception as e:
+            st.error(f"Error: {e}")
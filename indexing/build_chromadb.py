@@ -1,7 +1,15 @@
+import hashlib
 import json
+import multiprocessing
 import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 import chromadb
-from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from vector_index import FusedIndex  # noqa: E402
 
 # -------------------------
 # FILE PATHS
@@ -14,99 +22,310 @@ EXPLAIN_PATH = "./julius_caesar_explanation_chunks.jsonl"   # NEW
 # Where Chroma will be saved (persistent)
 CHROMA_PATH = "./chroma_julius_caesar"
 
+# Per-chunk content hashes + index version (read by backend/rag.py)
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "index_manifest.json")
+
+# Memory-mapped embedding store (vectors + columnar metadata) loaded
+# zero-copy by backend/rag.py
+STORE_PATH = os.path.join(CHROMA_PATH, "embedding_store")
+STORE_DTYPE = os.getenv("EMBED_STORE_DTYPE", "float32")   # float32 | float16
+
+SOURCES = {
+    "speaker":     SPEAKER_PATH,
+    "context":     CONTEXT_PATH,
+    "scene":       SCENE_PATH,
+    "explanation": EXPLAIN_PATH,   # NEW
+}
+
+COLLECTION_NAMES = {
+    "speaker":     "julius_caesar_speaker",
+    "context":     "julius_caesar_context",
+    "scene":       "julius_caesar_scene",
+    "explanation": "julius_caesar_explanation",
+}
+
+# -------------------------
+# PIPELINE SETTINGS
+# -------------------------
+MODEL_NAME = "BAAI/bge-base-en-v1.5"
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "64"))       # chunks per encode / upsert
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_IN_FLIGHT = EMBED_WORKERS * 2                        # batches queued on the pool
+
+
+# Context windows span speaker chunks [STEP*i, STEP*i + WINDOW)
+# (must match chunking/context_window.py)
+WINDOW_SIZE = 5
+STEP_SIZE = 3
+
 
 # -------------------------
-# LOAD CHUNKS
+# SPEAKERS: who speaks in each speaker chunk and in each scene,
+# so windows / scenes / explanations can be filtered by speaker
 # -------------------------
-def load_chunks(path):
-    data = []
+def load_speakers():
+    by_id, by_scene = {}, {}
+    if not os.path.exists(SPEAKER_PATH):
+        return by_id, by_scene
+
+    with open(SPEAKER_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            c = json.loads(line)
+            speaker = c.get("speaker")
+            if not speaker:
+                continue
+            by_id[int(c["id"])] = speaker
+            names = by_scene.setdefault((c.get("act"), c.get("scene")), [])
+            if speaker not in names:
+                names.append(speaker)
+    return by_id, by_scene
+
+
+def chunk_speakers(name, c, speakers):
+    by_id, by_scene = speakers
+    if name == "context":
+        start = int(c["id"]) * STEP_SIZE
+        window = [by_id.get(i) for i in range(start, start + WINDOW_SIZE)]
+        return list(dict.fromkeys(s for s in window if s))
+    return by_scene.get((c.get("act"), c.get("scene")), [])
+
+
+# -------------------------
+# STREAM CHUNKS (lazy, one line at a time)
+# -------------------------
+def iter_chunks(name, path, speakers):
     if not os.path.exists(path):
         print(f"⚠️ File not found: {path}")
-        return []
+        return
 
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
-            data.append(json.loads(line.strip()))
-    return data
+            if not line.strip():
+                continue
+            c = json.loads(line)
+            if not c.get("text"):
+                continue
 
+            meta = {
+                "act": c.get("act"),
+                "scene": c.get("scene"),
+                "type": c.get("type")
+            }
+            # Chroma rejects None metadata values, so unset keys are omitted
+            if name == "speaker":
+                if c.get("speaker"):
+                    meta["speaker"] = c["speaker"]
+            else:
+                names = chunk_speakers(name, c, speakers)
+                if names:
+                    meta["speakers"] = "|".join(names)
+            yield str(c["id"]), c["text"], meta
 
-speaker_chunks   = load_chunks(SPEAKER_PATH)
-context_chunks   = load_chunks(CONTEXT_PATH)
-scene_chunks     = load_chunks(SCENE_PATH)
-explain_chunks   = load_chunks(EXPLAIN_PATH)   # NEW
 
-print(f"Speaker chunks: {len(speaker_chunks)}")
-print(f"Context-window chunks: {len(context_chunks)}")
-print(f"Scene chunks: {len(scene_chunks)}")
-print(f"Explanation chunks: {len(explain_chunks)}")
+def chunk_hash(doc, meta):
+    payload = json.dumps({"text": doc, "meta": meta}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
 
 # -------------------------
-# EMBEDDING MODEL
+# MANIFEST
 # -------------------------
-print("\n🔹 Loading embedding model (bge-base-en-v1.5)...")
-embedder = SentenceTransformer("BAAI/bge-base-en-v1.5")
-print("✅ Embedding model loaded.\n")
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {"collections": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    # Index version = hash over every (collection, id, chunk hash)
+    h = hashlib.sha1()
+    for name in sorted(manifest["collections"]):
+        for cid, digest in sorted(manifest["collections"][name].items()):
+            h.update(f"{name}:{cid}:{digest}\n".encode("utf-8"))
+    manifest["version"] = h.hexdigest()[:16]
+    manifest["built_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+    return manifest["version"]
 
 
 # -------------------------
-# INITIALIZE CHROMA (PERSISTENT)
+# EMBEDDING WORKERS (one model per process)
 # -------------------------
-print(f"📦 Initializing Chroma at: {CHROMA_PATH}")
-client = chromadb.PersistentClient(path=CHROMA_PATH)
+_embedder = None
 
-collections = {
-    "speaker":     client.get_or_create_collection("julius_caesar_speaker"),
-    "context":     client.get_or_create_collection("julius_caesar_context"),
-    "scene":       client.get_or_create_collection("julius_caesar_scene"),
-    "explanation": client.get_or_create_collection("julius_caesar_explanation")  # NEW
-}
+def init_worker(threads):
+    global _embedder
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _embedder = SentenceTransformer(MODEL_NAME)
+
+
+def embed_batch(batch):
+    name, ids, docs, metas, hashes = batch
+    vectors = _embedder.encode(docs, normalize_embeddings=True).tolist()
+    return name, ids, docs, metas, hashes, vectors
 
 
 # -------------------------
-# ADD TO COLLECTION
+# PLAN: diff every collection against the manifest
+# (only ids + hashes are kept in memory)
 # -------------------------
-def add_to_collection(collection, chunks):
-    docs = []
-    metas = []
-    ids = []
+def plan(collections, manifest, speakers):
+    changed_ids, removed_ids, current = {}, {}, {}
 
-    for c in chunks:
-        if not c.get("text"):
-            continue
+    for name, path in SOURCES.items():
+        previous = manifest["collections"].get(name)
+        if previous is None:
+            # No manifest yet: anything already stored is unverified
+            stored = collections[name].get(include=[])["ids"]
+            previous = {cid: None for cid in stored}
 
-        docs.append(c["text"])
-        metas.append({
-            "act": c.get("act"),
-            "scene": c.get("scene"),
-            "type": c.get("type")
-        })
-        ids.append(str(c["id"]))
+        hashes = {cid: chunk_hash(doc, meta) for cid, doc, meta in iter_chunks(name, path, speakers)}
+        changed_ids[name] = {cid for cid, digest in hashes.items() if previous.get(cid) != digest}
+        removed_ids[name] = [cid for cid in previous if cid not in hashes]
+        current[name] = hashes
 
-    if not docs:
-        print(f"⚠️ No docs for collection: {collection.name}")
-        return
+        # Start from what is already correct; changed ids get added once written
+        manifest["collections"][name] = {
+            cid: digest for cid, digest in hashes.items() if cid not in changed_ids[name]
+        }
+
+        print(f"🔹 {name}: {len(hashes)} chunks, {len(changed_ids[name])} new/changed, "
+              f"{len(removed_ids[name])} removed")
 
-    print(f"🔹 Embedding {len(docs)} items for '{collection.name}'...")
-    vectors = embedder.encode(docs, normalize_embeddings=True).tolist()
+    return changed_ids, removed_ids, current
 
-    collection.add(
-        documents=docs,
-        embeddings=vectors,
-        metadatas=metas,
-        ids=ids
-    )
 
-    print(f"✅ Done: {collection.name}\n")
+def iter_batches(changed_ids, current, speakers):
+    # Batches never mix collections (each is one upsert)
+    for name, path in SOURCES.items():
+        wanted = changed_ids[name]
+        if not wanted:
+            continue
+
+        batch = ([], [], [], [])
+        for cid, doc, meta in iter_chunks(name, path, speakers):
+            if cid not in wanted:
+                continue
+            for lst, v in zip(batch, (cid, doc, meta, current[name][cid])):
+                lst.append(v)
+            if len(batch[0]) >= EMBED_BATCH:
+                yield (name, *batch)
+                batch = ([], [], [], [])
+        if batch[0]:
+            yield (name, *batch)
 
 
 # -------------------------
-# ADD ALL CHUNK TYPES
+# RUN: stream batches through the pool, write as they finish
 # -------------------------
-add_to_collection(collections["speaker"], speaker_chunks)
-add_to_collection(collections["context"], context_chunks)
-add_to_collection(collections["scene"], scene_chunks)
-add_to_collection(collections["explanation"], explain_chunks)   # NEW
+def run_pipeline(collections, manifest, changed_ids, current, speakers):
+    total = sum(len(v) for v in changed_ids.values())
+    if total == 0:
+        return 0
+
+    done = 0
+    t0 = time.perf_counter()
+
+    def write(result):
+        nonlocal done
+        name, ids, docs, metas, hashes, vectors = result
+        collections[name].upsert(documents=docs, embeddings=vectors, metadatas=metas, ids=ids)
+        manifest["collections"][name].update(zip(ids, hashes))
+
+        done += len(ids)
+        rate = done / max(time.perf_counter() - t0, 1e-9)
+        print(f"   {done}/{total} chunks ({rate:.1f} chunks/s) — {name}")
+
+    threads = max(1, (os.cpu_count() or 1) // EMBED_WORKERS)
+    print(f"🔹 Embedding {total} chunks: {EMBED_WORKERS} worker(s) x {threads} thread(s), "
+          f"batch {EMBED_BATCH}")
+
+    if EMBED_WORKERS <= 1:
+        init_worker(threads)
+        for batch in iter_batches(changed_ids, current, speakers):
+            write(embed_batch(batch))
+    else:
+        # spawn, not fork: this process already holds Chroma's SQLite
+        # handles and native threads; workers load their own model anyway
+        with ProcessPoolExecutor(EMBED_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_worker, initargs=(threads,)) as pool:
+            pending = set()
+            for batch in iter_batches(changed_ids, current, speakers):
+                # Bounded queue: never hold more than MAX_IN_FLIGHT batches
+                if len(pending) >= MAX_IN_FLIGHT:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        write(fut.result())
+                pending.add(pool.submit(embed_batch, batch))
+
+            for fut in wait(pending).done:
+                write(fut.result())
+
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Embedded {total} chunks in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} chunks/s)\n")
+    return total
+
+
+def main():
+    t0 = time.perf_counter()
+
+    # -------------------------
+    # INITIALIZE CHROMA (PERSISTENT)
+    # -------------------------
+    print(f"📦 Initializing Chroma at: {CHROMA_PATH}")
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collections = {
+        name: client.get_or_create_collection(cname)
+        for name, cname in COLLECTION_NAMES.items()
+    }
+
+    manifest = load_manifest()
+    speakers = load_speakers()
+    changed_ids, removed_ids, current = plan(collections, manifest, speakers)
+
+    try:
+        for name, ids in removed_ids.items():
+            if ids:
+                print(f"🗑️ Removing {len(ids)} stale items from '{collections[name].name}'")
+                collections[name].delete(ids=ids)
+
+        run_pipeline(collections, manifest, changed_ids, current, speakers)
+    finally:
+        # Checkpoint: whatever was written is recorded, so a rerun resumes
+        version = save_manifest(manifest)
+
+    print(f"\n🎉 All Chroma collections synced in {time.perf_counter() - t0:.1f}s")
+    print(f"🔖 Index version: {version}")
+    print(f"📁 Stored at: {CHROMA_PATH}")
+
+    # -------------------------
+    # EMBEDDING STORE (read back from Chroma so it always matches)
+    # -------------------------
+    t1 = time.perf_counter()
+    store = FusedIndex.from_chroma(collections, version=version)
+    store.save(STORE_PATH, dtype=STORE_DTYPE)
+    print(f"✅ Embedding store: {len(store)} rows, {STORE_DTYPE} "
+          f"({time.perf_counter() - t1:.2f}s)")
+    print(f"📁 Stored at: {STORE_PATH}")
+
+    # -------------------------
+    # LEXICAL (BM25) INDEX alongside the Chroma store
+    # -------------------------
+    from build_lexical import build_lexical_index
+
+    build_lexical_index()
+
 
-print("\n🎉 All Chroma collections updated successfully!")
-print(f"📁 Stored at: {CHROMA_PATH}")
+if __name__ == "__main__":
+    main()
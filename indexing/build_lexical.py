@@ -0,0 +1,62 @@
+# ===============================================================
+# Build the BM25 lexical index over all four chunk levels and
+# persist it next to the Chroma store (loaded by backend/rag.py).
+# ===============================================================
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from lexical import LexicalIndex  # noqa: E402
+
+# -------------------------
+# FILE PATHS (same layout as build_chromadb.py)
+# -------------------------
+CHUNK_PATHS = {
+    "speaker":     "./julius_caesar_chunks.jsonl",
+    "context":     "./julius_caesar_context_windows.jsonl",
+    "scene":       "./julius_caesar_scene_chunks.jsonl",
+    "explanation": "./julius_caesar_explanation_chunks.jsonl",
+}
+
+CHROMA_PATH = "./chroma_julius_caesar"
+LEXICAL_PATH = os.path.join(CHROMA_PATH, "lexical_index.npz")
+
+SPEAKER_BOOST = 2.0
+
+
+def iter_docs():
+    for collection, path in CHUNK_PATHS.items():
+        if not os.path.exists(path):
+            print(f"⚠️ File not found: {path}")
+            continue
+
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                c = json.loads(line)
+                if not c.get("text"):
+                    continue
+                # ids must match the ones written to Chroma
+                yield collection, str(c["id"]), c["text"], c.get("speaker") or ""
+
+
+def build_lexical_index(out_path=LEXICAL_PATH):
+    t0 = time.perf_counter()
+    index = LexicalIndex.build(iter_docs(), speaker_boost=SPEAKER_BOOST)
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    index.save(out_path)
+
+    vocab = len(index.fields["text"].vocab)
+    print(f"✅ Lexical index: {len(index)} docs, {vocab} terms, "
+          f"version {index.version} ({time.perf_counter() - t0:.2f}s)")
+    print(f"📁 Stored at: {out_path}")
+    return index
+
+
+if __name__ == "__main__":
+    build_lexical_index()
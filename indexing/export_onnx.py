@@ -0,0 +1,74 @@
+# ===============================================================
+# Export bge-base-en-v1.5 to ONNX (+ dynamic int8 quantization)
+# for the backend's EMBED_BACKEND=onnx / onnx-int8 modes.
+#
+#   python export_onnx.py                 -> ./onnx_bge/
+#   python export_onnx.py ../backend/onnx_bge
+# ===============================================================
+
+import os
+import sys
+
+import torch
+from transformers import AutoModel, AutoTokenizer
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+MODEL_NAME = "BAAI/bge-base-en-v1.5"
+OUT_DIR = sys.argv[1] if len(sys.argv) > 1 else "./onnx_bge"
+
+
+# -------------------------
+# EXPORT FP32
+# -------------------------
+def export_fp32(out_dir):
+    print(f"🔹 Loading {MODEL_NAME}...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModel.from_pretrained(MODEL_NAME).eval()
+
+    # tokenizer.json is all the backend needs at runtime (no transformers)
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["Beware the ides of March."], return_tensors="pt")
+    inputs = (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"])
+    dynamic = {"input_ids": {0: "batch", 1: "seq"},
+               "attention_mask": {0: "batch", 1: "seq"},
+               "token_type_ids": {0: "batch", 1: "seq"},
+               "last_hidden_state": {0: "batch", 1: "seq"}}
+
+    path = os.path.join(out_dir, "model.onnx")
+    print(f"🔹 Exporting to {path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            inputs,
+            path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=17,
+        )
+    return path
+
+
+# -------------------------
+# QUANTIZE INT8
+# -------------------------
+def quantize(fp32_path, out_dir):
+    path = os.path.join(out_dir, "model.int8.onnx")
+    print(f"🔹 Quantizing (dynamic int8) to {path}...")
+    quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    return path
+
+
+def main():
+    os.makedirs(OUT_DIR, exist_ok=True)
+    fp32 = export_fp32(OUT_DIR)
+    int8 = quantize(fp32, OUT_DIR)
+
+    for p in (fp32, int8):
+        print(f"✅ {p}: {os.path.getsize(p) / 1e6:.1f} MB")
+    print("\nRun evaluate/onnx_parity.py to check vectors and recall against torch.")
+
+
+if __name__ == "__main__":
+    main()